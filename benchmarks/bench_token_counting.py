@@ -0,0 +1,62 @@
+"""Micro-benchmark: splitting the data/ corpus with the old and the cached token counter.
+
+    python -m benchmarks.bench_token_counting
+"""
+import os
+import time
+import tiktoken
+from langchain_community.document_loaders import TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import helper_functions.llm as llm
+from logics.ingestion import filename_list, CHUNK_SIZE, CHUNK_OVERLAP
+
+
+# The token counter as it was before: the encoder is looked up on every call
+def count_tokens_uncached(text):
+    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
+    return len(encoding.encode(text))
+
+
+def time_split(documents, length_function, repeat, clear_cache=False):
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                                   length_function=length_function)
+    timings = []
+    for _ in range(repeat):
+        if clear_cache:
+            llm._token_count_cache.clear()
+        start = time.perf_counter()
+        chunks = text_splitter.split_documents(documents)
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(chunks)
+
+
+def main(repeat=5):
+    documents = []
+    for filename in filename_list:
+        documents.extend(TextLoader(os.path.join('data', filename)).load())
+
+    # Make sure the encoding file is downloaded before anything is timed
+    llm.get_encoding()
+
+    before, num_chunks = time_split(documents, count_tokens_uncached, repeat)
+
+    # Cold: the count cache is emptied before every split, so only repeats within one split are cached
+    cold, _ = time_split(documents, llm.count_tokens, repeat, clear_cache=True)
+    # Warm: the corpus was split before, e.g. when the index is rebuilt in the same process
+    warm, _ = time_split(documents, llm.count_tokens, repeat)
+
+    texts = [chunk for document in documents for chunk in document.page_content.split('\n')]
+    llm._token_count_cache.clear()
+    start = time.perf_counter()
+    llm.count_tokens_many(texts)
+    batched = time.perf_counter() - start
+
+    print(f"{num_chunks} chunks from {len(documents)} documents, best of {repeat} runs")
+    print(f"encoder looked up per call:   {before * 1000:8.2f} ms")
+    print(f"cached counter, cold cache:   {cold * 1000:8.2f} ms  ({before / cold:.1f}x faster)")
+    print(f"cached counter, warm cache:   {warm * 1000:8.2f} ms  ({before / warm:.1f}x faster)")
+    print(f"count_tokens_many over {len(texts)} lines: {batched * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Query latency and memory of the Chroma and NumPy vector backends on synthetic embeddings.
+
+    python -m benchmarks.bench_vector_backends --sizes 100 10000 100000
+
+Both stores are built from the same random unit vectors, then each backend is loaded and queried in a fresh
+subprocess, so the reported memory is what serving that index costs on top of a bare interpreter.
+"""
+import helper_functions.sqlite_patch
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from helper_functions.tracing import percentile
+
+
+COLLECTION_NAME = "bench"
+
+
+class QueryEmbeddings(Embeddings):
+    # Query "q<i>" is embedded as row i of a fixed matrix, so no model or network is involved
+    def __init__(self, queries):
+        self.queries = queries
+
+    def embed_query(self, text):
+        return self.queries[int(text[1:])].tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def random_unit_vectors(rng, n, dim):
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def rss_mb():
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build_stores(path, size, dim):
+    import chromadb
+    from logics.numpy_store import EMBEDDINGS_FILENAME, CHUNKS_FILENAME
+
+    vectors = random_unit_vectors(np.random.default_rng(0), size, dim)
+    ids = [f"chunk-{i}" for i in range(size)]
+    texts = [f"synthetic chunk {i}" for i in range(size)]
+
+    np.save(os.path.join(path, EMBEDDINGS_FILENAME), vectors)
+    with open(os.path.join(path, CHUNKS_FILENAME), 'w') as file:
+        for id, text in zip(ids, texts):
+            file.write(json.dumps({'id': id, 'text': text, 'metadata': {}}) + "\n")
+
+    client = chromadb.PersistentClient(path=os.path.join(path, 'chroma'))
+    collection = client.create_collection(COLLECTION_NAME)
+    batch_size = client.get_max_batch_size()
+    for start in range(0, size, batch_size):
+        end = start + batch_size
+        collection.add(ids=ids[start:end], embeddings=vectors[start:end], documents=texts[start:end])
+
+
+def query_worker(backend, path, dim, num_queries, k):
+    # Both backends are imported before measuring, so load time and memory are those of the index alone
+    from logics.numpy_store import NumpyVectorStore
+    from langchain_chroma import Chroma
+
+    queries = random_unit_vectors(np.random.default_rng(1), num_queries, dim)
+    embeddings = QueryEmbeddings(queries)
+    baseline = rss_mb()
+
+    start = time.perf_counter()
+    if backend == 'numpy':
+        store = NumpyVectorStore.load(path, embeddings)
+    else:
+        store = Chroma(collection_name=COLLECTION_NAME, embedding_function=embeddings,
+                       persist_directory=os.path.join(path, 'chroma'))
+    load_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for i in range(num_queries):
+        start = time.perf_counter()
+        store.similarity_search_with_relevance_scores(f"q{i}", k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    # the first queries warm up caches and the HNSW index, so they are left out
+    latencies = latencies[num_queries // 10:]
+
+    print(json.dumps({
+        'backend': backend,
+        'load_ms': load_ms,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'rss_mb': rss_mb() - baseline,
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Chroma and NumPy vector backends.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--dim', type=int, default=1536, help="text-embedding-3-small has 1536 dimensions")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--worker', nargs=2, metavar=('BACKEND', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        query_worker(args.worker[0], args.worker[1], args.dim, args.queries, args.k)
+        return
+
+    results = []
+    for size in args.sizes:
+        path = tempfile.mkdtemp(prefix="bench_vectors_")
+        try:
+            build_stores(path, size, args.dim)
+            for backend in ['chroma', 'numpy']:
+                output = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_vector_backends', '--dim', str(args.dim),
+                     '--queries', str(args.queries), '--k', str(args.k), '--worker', backend, path],
+                    check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                result['chunks'] = size
+                results.append(result)
+                print(f"{size:7d} chunks  {backend:6s}  load {result['load_ms']:8.1f} ms  "
+                      f"p50 {result['p50_ms']:7.3f} ms  p95 {result['p95_ms']:7.3f} ms  "
+                      f"memory +{result['rss_mb']:7.1f} MB")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
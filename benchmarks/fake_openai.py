@@ -0,0 +1,221 @@
+"""Local, deterministic stand-in for the OpenAI API, for benchmarks.
+
+`install()` swaps the OpenAI SDK clients in helper_functions.llm and the LangChain `ChatOpenAI` / `OpenAIEmbeddings`
+classes for fakes that answer from this process. Call it before importing logics.query_handler or
+logics.product_handler, since they create their models at import time.
+
+Completions wait `latency` seconds before the first token and then emit `tokens_per_second` tokens per second.
+Embeddings are seeded by a hash of the text, so the same text always gets the same unit vector.
+"""
+import time
+import types
+import asyncio
+import hashlib
+from typing import Any
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# text-embedding-3-small has 1536 dimensions
+EMBEDDING_DIM = 1536
+ANSWER_WORDS = ("Here are some practical ways to save energy at home with efficient appliances and "
+                "good habits that lower your electricity bill every month").split()
+
+
+class FakeBackend:
+    def __init__(self, latency=0.2, tokens_per_second=200.0, embedding_latency=0.05, answer_tokens=60,
+                 dim=EMBEDDING_DIM):
+        self.latency = latency
+        # 0 generates the whole answer at once, after `latency`
+        self.tokens_per_second = tokens_per_second
+        self.embedding_latency = embedding_latency
+        self.answer_tokens = answer_tokens
+        self.dim = dim
+        self.completion_calls = 0
+        self.embedding_calls = 0
+
+    def embed(self, texts):
+        self.embedding_calls += 1
+        time.sleep(self.embedding_latency)
+        return [self.vector(text) for text in texts]
+
+    async def aembed(self, texts):
+        self.embedding_calls += 1
+        await asyncio.sleep(self.embedding_latency)
+        return [self.vector(text) for text in texts]
+
+    def vector(self, text):
+        seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def answer_tokens_list(self):
+        self.completion_calls += 1
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + ' ' for i in range(self.answer_tokens)]
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def usage(self, prompt):
+        # whitespace tokens are close enough for a benchmark, and avoid loading tiktoken in the fake
+        return len(prompt.split()), self.answer_tokens
+
+
+def _prompt_text(messages):
+    return ' '.join(message['content'] if isinstance(message, dict) else str(message.content) for message in messages)
+
+
+def _usage(prompt_tokens, completion_tokens):
+    return types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                 total_tokens=prompt_tokens + completion_tokens,
+                                 prompt_tokens_details=types.SimpleNamespace(cached_tokens=0))
+
+
+def _completion(text, usage):
+    message = types.SimpleNamespace(content=text)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+
+def _chunk(content=None, usage=None):
+    choices = [types.SimpleNamespace(delta=types.SimpleNamespace(content=content))] if content is not None else []
+    return types.SimpleNamespace(choices=choices, usage=usage)
+
+
+def _embedding_response(vectors):
+    return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=vector) for vector in vectors])
+
+
+class FakeOpenAI:
+    """Replaces openai.OpenAI for `chat.completions.create` and `embeddings.create`."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create_completion))
+        self.embeddings = types.SimpleNamespace(create=self.create_embedding)
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create_embedding(self, input, **kwargs):
+        return _embedding_response(self.backend.embed([input] if isinstance(input, str) else input))
+
+    def create_completion(self, messages, stream=False, **kwargs):
+        prompt_tokens, completion_tokens = self.backend.usage(_prompt_text(messages))
+        tokens = self.backend.answer_tokens_list()
+        if stream:
+            return self._stream(tokens, _usage(prompt_tokens, completion_tokens))
+        time.sleep(self.backend.latency + len(tokens) * self.backend.token_delay())
+        return _completion(''.join(tokens), _usage(prompt_tokens, completion_tokens))
+
+    def _stream(self, tokens, usage):
+        time.sleep(self.backend.latency)
+        for token in tokens:
+            yield _chunk(token)
+            time.sleep(self.backend.token_delay())
+        yield _chunk(usage=usage)
+
+
+class FakeAsyncOpenAI:
+    """Replaces openai.AsyncOpenAI, like FakeOpenAI."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create_completion))
+        self.embeddings = types.SimpleNamespace(create=self.create_embedding)
+
+    async def create_embedding(self, input, **kwargs):
+        return _embedding_response(await self.backend.aembed([input] if isinstance(input, str) else input))
+
+    async def create_completion(self, messages, stream=False, **kwargs):
+        prompt_tokens, completion_tokens = self.backend.usage(_prompt_text(messages))
+        tokens = self.backend.answer_tokens_list()
+        if stream:
+            return self._stream(tokens, _usage(prompt_tokens, completion_tokens))
+        await asyncio.sleep(self.backend.latency + len(tokens) * self.backend.token_delay())
+        return _completion(''.join(tokens), _usage(prompt_tokens, completion_tokens))
+
+    async def _stream(self, tokens, usage):
+        await asyncio.sleep(self.backend.latency)
+        for token in tokens:
+            yield _chunk(token)
+            await asyncio.sleep(self.backend.token_delay())
+        yield _chunk(usage=usage)
+
+
+class FakeEmbeddings(Embeddings):
+    """Replaces langchain_openai.OpenAIEmbeddings."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def embed_documents(self, texts):
+        return self.backend.embed(texts)
+
+    def embed_query(self, text):
+        return self.backend.embed([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await self.backend.aembed(texts)
+
+    async def aembed_query(self, text):
+        return (await self.backend.aembed([text]))[0]
+
+
+class FakeChatOpenAI(BaseChatModel):
+    """Replaces langchain_openai.ChatOpenAI, with the token usage reported like stream_usage=True."""
+
+    backend: Any
+
+    @property
+    def _llm_type(self):
+        return "fake-openai"
+
+    def _usage_metadata(self, messages):
+        input_tokens, output_tokens = self.backend.usage(_prompt_text(messages))
+        return {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.backend.answer_tokens_list()
+        time.sleep(self.backend.latency + len(tokens) * self.backend.token_delay())
+        message = AIMessage(content=''.join(tokens), usage_metadata=self._usage_metadata(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.backend.answer_tokens_list()
+        await asyncio.sleep(self.backend.latency + len(tokens) * self.backend.token_delay())
+        message = AIMessage(content=''.join(tokens), usage_metadata=self._usage_metadata(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.backend.answer_tokens_list()
+        time.sleep(self.backend.latency)
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self.backend.token_delay())
+        yield ChatGenerationChunk(message=AIMessageChunk(content='', usage_metadata=self._usage_metadata(messages)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self.backend.answer_tokens_list()
+        await asyncio.sleep(self.backend.latency)
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.backend.token_delay())
+        yield ChatGenerationChunk(message=AIMessageChunk(content='', usage_metadata=self._usage_metadata(messages)))
+
+
+def install(backend):
+    """Routes every OpenAI call of the app to `backend`."""
+    import langchain_openai
+    import helper_functions.llm as llm
+
+    client = FakeOpenAI(backend)
+    async_client = FakeAsyncOpenAI(backend)
+    llm.get_openai_key = lambda: "sk-benchmark"
+    llm.get_client = lambda: client
+    llm.get_async_client = lambda: async_client
+    langchain_openai.OpenAIEmbeddings = lambda **kwargs: FakeEmbeddings(backend)
+    langchain_openai.ChatOpenAI = lambda **kwargs: FakeChatOpenAI(backend=backend)
+    return backend
@@ -0,0 +1,70 @@
+"""Load test of the async request path with a stubbed LLM.
+
+Each simulated user is a thread, like a Streamlit session, that submits questions one after another through
+the shared event loop. The OpenAI API is replaced by benchmarks.fake_openai, answering after a fixed delay, so the
+numbers show how well one process overlaps requests, not the speed of the API.
+
+    python -m benchmarks.load_test --users 1 10 50 --latency 0.5
+"""
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import helper_functions.llm as llm
+from helper_functions.tracing import percentile
+from helper_functions.async_runner import run_async
+from logics.product_handler import aidentify_product_category
+from benchmarks.fake_openai import FakeBackend, install
+
+
+# Questions the product matcher cannot resolve on its own, so every request goes to the (stubbed) LLM
+QUESTIONS = [
+    "Which taps can I buy with the vouchers?",
+    "Can I use the vouchers for an instantaneous water heater?",
+    "What products can I buy?",
+    "Is a 5 tick aircon with a dehumidifier covered?",
+]
+
+
+def run_user(num_requests, offset):
+    latencies = []
+    for i in range(num_requests):
+        question = QUESTIONS[(offset + i) % len(QUESTIONS)]
+        start = time.perf_counter()
+        run_async(aidentify_product_category(question))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_load(users, requests_per_user):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = list(pool.map(run_user, [requests_per_user] * users, range(users)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for user_latencies in results for latency in user_latencies]
+    return {
+        'users': users,
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--requests-per-user', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds the fake LLM takes per answer")
+    args = parser.parse_args(argv)
+
+    install(FakeBackend(latency=args.latency, tokens_per_second=0))
+
+    print(f"fake LLM latency {args.latency * 1000:.0f} ms, limit of {llm.MAX_CONCURRENT_REQUESTS} concurrent requests")
+    for users in args.users:
+        result = run_load(users, args.requests_per_user)
+        print(f"{result['users']:4d} users: {result['throughput_rps']:8.1f} req/s, "
+              f"p50 {result['p50_ms']:7.1f} ms, p95 {result['p95_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
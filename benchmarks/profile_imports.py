@@ -0,0 +1,71 @@
+"""Import-time profile of the Streamlit entry point.
+
+    python -m benchmarks.profile_imports
+
+Finds the imports that run at the top of `main.py`, before the password gate, and times them in a fresh
+interpreter with `python -X importtime`. The imports of logics/query_handler.py, which the advisor loads later,
+are profiled the same way for comparison. The slowest modules of each are listed, followed by the results as JSON.
+"""
+import re
+import ast
+import sys
+import json
+import argparse
+import subprocess
+
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def top_level_imports(path):
+    """The modules imported at module level of a script, i.e. before any of its code runs."""
+    with open(path, 'r') as file:
+        tree = ast.parse(file.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def profile(modules):
+    """Imports the modules in a fresh interpreter; returns the wall time and the cumulative time per module."""
+    code = "import time; start = time.perf_counter()\n"
+    code += ''.join(f"import {module}\n" for module in modules)
+    code += "print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2)) / 1000
+    return float(result.stdout.strip().splitlines()[-1]), cumulative
+
+
+def report(name, modules, top):
+    wall_s, cumulative = profile(modules)
+    print(f"{name}: {wall_s * 1000:.0f} ms to import {', '.join(modules)}")
+    for module, ms in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {ms:8.1f} ms  {module}")
+    return {'modules': modules, 'import_ms': wall_s * 1000,
+            'slowest': dict(sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:top])}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the imports of the Streamlit entry point.")
+    parser.add_argument('--entry-point', default='main.py')
+    parser.add_argument('--top', type=int, default=15, help="number of slowest modules to list")
+    args = parser.parse_args(argv)
+
+    results = {
+        'login_page': report("Login page", top_level_imports(args.entry_point), args.top),
+        'advisor': report("Advisor (loaded in the background)", top_level_imports('logics/query_handler.py'), args.top),
+    }
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""End-to-end benchmarks of both advisors against a local fake of the OpenAI API.
+
+    python -m benchmarks.run_benchmarks --output bench_results.json
+
+Measures, on a fixed query set:
+- index build time of the corpus in `data/`,
+- cold start: importing logics.query_handler (models, index, lexical index) in a fresh interpreter,
+- per-query latency (time to first token and total) of the streaming paths the pages use,
+- throughput of the async paths at several concurrency levels.
+
+All OpenAI calls go to benchmarks.fake_openai, so the numbers are the app's own overhead plus the configured
+fake latency, and runs on different commits can be compared. The index, answer cache and trace log live in
+a temporary directory; the answer cache is cleared before each advisor query so every query runs the full pipeline.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fake_openai import FakeBackend, install
+
+
+ADVISOR_QUERIES = [
+    "How can I reduce the energy used by my air conditioner?",
+    "What should I look out for when buying a new refrigerator?",
+    "How do I save water and energy in the shower?",
+    "Is it better to switch off appliances at the wall?",
+    "How many ticks should an energy efficient washing machine have?",
+    "What temperature should I set my aircon to?",
+    "Do LED lights really save electricity?",
+    "How can I lower my monthly electricity bill?",
+]
+
+# A mix of questions the product matcher answers by itself and questions that need the LLM
+ELIGIBILITY_QUERIES = [
+    "refrigerator",
+    "Can I buy a washing machine with the vouchers?",
+    "LED light",
+    "Which taps can I buy with the vouchers?",
+    "Can I use the vouchers for an instantaneous water heater?",
+    "What products can I buy?",
+    "Is a 5 tick aircon with a dehumidifier covered?",
+    "shower fittings",
+]
+
+
+def summarize_latencies(latencies):
+    # imported here, since the trace log path is read on import and run() sets it first
+    from helper_functions.tracing import percentile
+
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def backend_argv(args):
+    return ['--latency', str(args.latency), '--tokens-per-second', str(args.tokens_per_second),
+            '--embedding-latency', str(args.embedding_latency), '--answer-tokens', str(args.answer_tokens)]
+
+
+def make_backend(args):
+    return FakeBackend(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                       embedding_latency=args.embedding_latency, answer_tokens=args.answer_tokens)
+
+
+def bench_index_build(backend, data_dir, index_root):
+    from logics.build_index import build_index
+
+    start = time.perf_counter()
+    version = build_index(data_dir, index_root, embed_fn=backend.embed)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    build_index(data_dir, index_root, embed_fn=backend.embed)
+    return {'version': version, 'build_s': build_s, 'rebuild_unchanged_s': time.perf_counter() - start}
+
+
+def cold_start_worker(args):
+    # Runs in a fresh interpreter: the time to import the advisor, and with it every heavy dependency
+    start = time.perf_counter()
+    install(make_backend(args))
+    import logics.query_handler as query_handler
+    query_handler.preload()
+    print(json.dumps({'import_s': time.perf_counter() - start}))
+
+
+def bench_cold_start(args, runs):
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.run_benchmarks', '--cold-start-worker', *backend_argv(args)],
+                                check=True, capture_output=True, text=True).stdout
+        process_s = time.perf_counter() - start
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_s'] = process_s
+        results.append(result)
+    return {
+        'runs': runs,
+        'import_s': statistics.median(result['import_s'] for result in results),
+        'process_s': statistics.median(result['process_s'] for result in results),
+    }
+
+
+def time_stream(stream):
+    start = time.perf_counter()
+    first_token = None
+    for _ in stream:
+        if first_token is None:
+            first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start
+
+
+def bench_latency(make_stream, queries, repeats, before_query=None):
+    ttft, total = [], []
+    for _ in range(repeats):
+        for query in queries:
+            if before_query is not None:
+                before_query()
+            first_token, elapsed = time_stream(make_stream(query))
+            ttft.append(first_token)
+            total.append(elapsed)
+    return {'time_to_first_token': summarize_latencies(ttft), 'total': summarize_latencies(total)}
+
+
+def bench_throughput(call, queries, concurrency, requests_per_worker, unique=False):
+    from helper_functions.async_runner import run_async
+
+    def worker(offset):
+        latencies = []
+        for i in range(requests_per_worker):
+            query = queries[(offset + i) % len(queries)]
+            if unique:
+                # a new question each time, so answers are never served from the answer cache
+                query = f"{query} ({offset}-{i})"
+            start = time.perf_counter()
+            run_async(call(query))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for worker_latencies in results for latency in worker_latencies]
+    result = summarize_latencies(latencies)
+    result.update({'concurrency': concurrency, 'throughput_rps': len(latencies) / elapsed})
+    return result
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_app_")
+    # Point the app at the temporary index, answer cache and trace log before any of it is imported
+    os.environ['INDEX_ROOT'] = os.path.join(workdir, 'vector_db')
+    os.environ['ANSWER_CACHE_PATH'] = os.path.join(workdir, 'answer_cache.sqlite3')
+    os.environ['QUERY_EMBEDDING_CACHE_DIR'] = ''
+    os.environ['TRACE_LOG_PATH'] = os.path.join(workdir, 'traces.jsonl')
+    try:
+        backend = install(make_backend(args))
+        results = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'cold_start_worker')},
+        }
+
+        print("Building index...")
+        results['index_build'] = bench_index_build(backend, args.data_dir, os.environ['INDEX_ROOT'])
+
+        print("Measuring cold start...")
+        results['cold_start'] = bench_cold_start(args, args.cold_start_runs)
+
+        import logics.query_handler as query_handler
+        import logics.product_handler as product_handler
+        from helper_functions.async_runner import iterate_async
+
+        print("Measuring per-query latency...")
+        results['advisor_latency'] = bench_latency(
+            lambda query: iterate_async(query_handler.aprocess_user_message_stream(query)),
+            ADVISOR_QUERIES, args.repeats, before_query=query_handler.get_answer_cache().clear)
+        results['eligibility_latency'] = bench_latency(
+            lambda query: iterate_async(product_handler.aidentify_product_category_stream(query)),
+            ELIGIBILITY_QUERIES, args.repeats)
+
+        print("Measuring throughput...")
+        results['advisor_throughput'] = [
+            bench_throughput(query_handler.aprocess_user_message, ADVISOR_QUERIES, concurrency,
+                             args.requests_per_worker, unique=True)
+            for concurrency in args.concurrency]
+        results['eligibility_throughput'] = [
+            bench_throughput(product_handler.aidentify_product_category, ELIGIBILITY_QUERIES, concurrency,
+                             args.requests_per_worker)
+            for concurrency in args.concurrency]
+        results['fake_api_calls'] = {'completions': backend.completion_calls, 'embeddings': backend.embedding_calls}
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks with a fake OpenAI backend.")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds before the first token of a completion")
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help="0 returns the whole answer at once")
+    parser.add_argument('--embedding-latency', type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument('--answer-tokens', type=int, default=60)
+    parser.add_argument('--repeats', type=int, default=3, help="passes over the query set for the latency benchmark")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--requests-per-worker', type=int, default=5)
+    parser.add_argument('--cold-start-runs', type=int, default=3)
+    parser.add_argument('--output', help="write the JSON results to this file as well as to stdout")
+    parser.add_argument('--cold-start-worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cold_start_worker:
+        cold_start_worker(args)
+        return
+
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import queue
+import asyncio
+import threading
+import streamlit as st
+
+
+class AsyncRunner:
+    """Runs coroutines on one event loop in a background thread.
+
+    Every Streamlit session submits its LLM and retrieval calls to the same loop, so a single server process
+    overlaps all in-flight requests on one thread, and the per-loop clients and limiter are shared by all sessions.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-runner", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        # Blocks the calling thread until the coroutine finishes on the shared loop
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def iterate(self, async_generator):
+        # Turns an async generator running on the shared loop into a plain generator, e.g. for st.write_stream
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in async_generator:
+                    items.put(('item', item))
+            except Exception as e:
+                items.put(('error', e))
+                return
+            items.put(('end', None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == 'item':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            # stops the upstream request when the consumer goes away early, e.g. on a Streamlit rerun
+            future.cancel()
+
+
+@st.cache_resource
+def get_async_runner():
+    return AsyncRunner()
+
+
+def run_async(coro, timeout=None):
+    return get_async_runner().run(coro, timeout)
+
+
+def iterate_async(async_generator):
+    return get_async_runner().iterate(async_generator)
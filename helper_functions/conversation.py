@@ -0,0 +1,146 @@
+import os
+import asyncio
+from collections import deque
+from helper_functions.llm import count_tokens_from_message, aget_completion_by_messages
+from helper_functions.tracing import trace, set_attributes
+from logics.product_matcher import tokenize
+
+
+# Tokens of the most recent turns that are kept word for word; older turns are folded into the summary
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', '1500'))
+# The summary and every stored message are capped too, so a session's memory stays small however long it runs
+SUMMARY_MAX_TOKENS = int(os.getenv('MEMORY_SUMMARY_MAX_TOKENS', '200'))
+MESSAGE_MAX_CHARS = 2000
+
+# A question is rewritten before retrieval only when it cannot stand alone: it opens like a follow-up, or it uses
+# a pronoun without naming what it is about. Anything else is used as typed, so the answer cache still matches it.
+FOLLOW_UP_OPENINGS = ('what about', 'how about', 'and ', 'also ')
+PRONOUNS = {'it', 'its', 'they', 'them', 'their', 'these', 'those', 'one'}
+# Things a question can be about; a question naming one of them is taken to be standalone
+SUBJECT_WORDS = {
+    'aircon', 'conditioner', 'appliance', 'bulb', 'cistern', 'computer', 'cooker', 'cooktop', 'dishwasher',
+    'dryer', 'fan', 'freezer', 'fridge', 'heater', 'hob', 'kettle', 'lamp', 'led', 'light', 'lighting', 'microwave',
+    'mixer', 'oven', 'refrigerator', 'shower', 'stove', 'tap', 'television', 'toilet', 'tv', 'voucher', 'washer',
+    'washing', 'machine', 'wc',
+}
+
+REWRITE_INSTRUCTIONS = """Rewrite the user's follow-up question as a standalone question that can be understood \
+without the conversation. Keep it short and keep the user's wording where possible. Do not answer it.
+If the question is already standalone, return it unchanged. Return only the question."""
+
+SUMMARY_INSTRUCTIONS = """Update the summary of a conversation between a user and an assistant with the new turns \
+below. Keep the topics, products and facts that later questions may refer to, and drop everything else.
+Return only the summary, in a few sentences."""
+
+
+def _message(role, content):
+    return {'role': role, 'content': content[:MESSAGE_MAX_CHARS]}
+
+
+class ConversationMemory:
+    """The conversation of one session: a running summary plus the recent turns, within a token budget.
+
+    Keep one per page in st.session_state. Follow-up questions are rewritten into standalone ones, so retrieval,
+    the answer cache and request coalescing work on them as on any other question. Turns that leave the window
+    are summarised in the background; the summary is only waited for when the next rewrite needs it.
+    """
+
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary = ''
+        # (messages, tokens) of each turn, oldest first
+        self.turns = deque()
+        self.tokens = 0
+        self.last_rewrite = None
+        self._summary_task = None
+
+    def messages(self):
+        return [message for messages, _ in self.turns for message in messages]
+
+    def is_follow_up(self, question):
+        if not self.turns and not self.summary:
+            return False
+        text = question.strip().lower()
+        if text.startswith(FOLLOW_UP_OPENINGS):
+            return True
+        # singular forms, so that "fans" and "lights" count as subjects
+        words = set(tokenize(text))
+        return bool(PRONOUNS & words) and not SUBJECT_WORDS & words
+
+    async def astandalone_question(self, question):
+        """The question to answer: the question itself, or its rewrite if it refers back to the conversation."""
+        self.last_rewrite = None
+        if not self.is_follow_up(question):
+            return question
+        if self._summary_task is not None:
+            await asyncio.shield(self._summary_task)
+        with trace('rewrite'):
+            conversation = '\n'.join(f"{message['role'].capitalize()}: {message['content']}"
+                                     for message in self.messages())
+            content = f"Conversation summary: {self.summary}\n\n" if self.summary else ''
+            content += f"Conversation:\n{conversation}\n\nFollow-up question: {question}"
+            try:
+                rewrite = await aget_completion_by_messages([{'role': 'system', 'content': REWRITE_INSTRUCTIONS},
+                                                             {'role': 'user', 'content': content}], max_tokens=100)
+                rewrite = rewrite.strip() or question
+            except Exception as e:
+                # Answering the question as typed beats not answering it
+                set_attributes(rewrite_error=type(e).__name__)
+                rewrite = question
+            set_attributes(rewritten=rewrite != question)
+        if rewrite != question:
+            self.last_rewrite = rewrite
+        return rewrite
+
+    async def aadd_turn(self, question, answer):
+        messages = [_message('user', question), _message('assistant', answer)]
+        tokens = count_tokens_from_message(messages)
+        self.turns.append((messages, tokens))
+        self.tokens += tokens
+
+        # The newest turn always stays; the ones before it leave the window oldest first
+        evicted = []
+        while self.tokens > self.token_budget and len(self.turns) > 1:
+            messages, tokens = self.turns.popleft()
+            self.tokens -= tokens
+            evicted += messages
+        if evicted:
+            # Chained onto the previous summary, so the turns are folded in the order they left the window
+            self._summary_task = asyncio.create_task(self._asummarise(evicted, self._summary_task))
+
+    async def _asummarise(self, messages, previous=None):
+        if previous is not None:
+            await previous
+        with trace('summary'):
+            turns = '\n'.join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+            try:
+                self.summary = (await aget_completion_by_messages(
+                    [{'role': 'system', 'content': SUMMARY_INSTRUCTIONS},
+                     {'role': 'user', 'content': f"Summary so far: {self.summary or '(none)'}\n\nNew turns:\n{turns}"}],
+                    max_tokens=SUMMARY_MAX_TOKENS)).strip()
+            except Exception as e:
+                # The turns are dropped either way; the old summary is still correct, only less complete
+                set_attributes(summary_error=type(e).__name__)
+
+    def clear(self):
+        if self._summary_task is not None:
+            # called from the page's thread, while the task runs on the event loop
+            self._summary_task.get_loop().call_soon_threadsafe(self._summary_task.cancel)
+            self._summary_task = None
+        self.summary = ''
+        self.turns.clear()
+        self.tokens = 0
+        self.last_rewrite = None
+
+
+async def aconverse_stream(memory, user_message, astream_answer):
+    """Streams the answer of `astream_answer` to the standalone form of the question, then records the turn.
+
+    Recording the turn does not wait for the summary of the turns it pushes out of the window.
+    """
+    question = await memory.astandalone_question(user_message)
+    answer = []
+    async for chunk in astream_answer(question):
+        answer.append(chunk)
+        yield chunk
+    await memory.aadd_turn(user_message, ''.join(answer))
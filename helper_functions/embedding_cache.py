@@ -0,0 +1,259 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialised within the process
+    fcntl = None
+
+
+# Vectors kept in memory as float32 arrays, about 6 KB each for 1536 dimensions, so ~30 MB when full
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '5000'))
+# Directory of the on-disk store; set it to an empty string to keep the cache in memory only
+QUERY_EMBEDDING_CACHE_DIR = os.getenv('QUERY_EMBEDDING_CACHE_DIR', './vector_db/query_embeddings')
+# Vectors kept on disk, ~300 MB at 1536 dimensions; every process also holds all of their keys in memory
+QUERY_EMBEDDING_DISK_MAX_ENTRIES = int(os.getenv('QUERY_EMBEDDING_DISK_MAX_ENTRIES', '50000'))
+
+
+def normalise_query(text):
+    return ' '.join(text.lower().split())
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\n{normalise_query(text)}".encode('utf-8')).hexdigest()
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+class DiskVectorStore:
+    """Append-only store of float32 vectors: one raw row per key in `vectors.f32`, read through a memory map.
+
+    The keys are kept in `keys.jsonl`, one line per row. Writes hold an exclusive lock on the directory, so
+    several processes can share it; each one sees the others' entries after a restart. Once the store holds
+    `max_entries` vectors it starts over empty, by replacing both files; the memory-cached hot queries survive
+    that, and a process that still maps the old files notices the new ones before it reads or writes a row.
+    """
+
+    def __init__(self, directory, max_entries=QUERY_EMBEDDING_DISK_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, 'vectors.f32')
+        self.keys_path = os.path.join(directory, 'keys.jsonl')
+        self.lock_path = os.path.join(directory, 'lock')
+        self._lock = threading.Lock()
+        with self._lock, self._locked(exclusive=False):
+            self._read()
+
+    @contextmanager
+    def _locked(self, exclusive):
+        with open(self.lock_path, 'a') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _read(self):
+        """Loads the keys and maps the vectors; the caller holds both locks."""
+        self.rows = {}
+        self.dim = None
+        self._matrix = None
+        self._inode = _inode(self.vectors_path)
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.rows[record['key']] = record['row']
+                    self.dim = record['dim']
+        if self._inode is None:
+            self.rows = {}
+            return
+        # Ignore keys whose row did not make it to disk, e.g. after a crash between the two writes
+        self._map()
+        num_rows = 0 if self._matrix is None else self._matrix.shape[0]
+        self.rows = {key: row for key, row in self.rows.items() if row < num_rows}
+
+    def _map(self):
+        num_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if self.dim else 0
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                 shape=(num_rows, self.dim)) if num_rows else None
+
+    def _reset(self):
+        """Replaces both files with empty ones; the caller holds both locks."""
+        for path in [self.keys_path, self.vectors_path]:
+            open(path + '.tmp', 'wb').close()
+            # the keys go first, so a crash in between leaves no key pointing into the old vectors
+            os.replace(path + '.tmp', path)
+        self._read()
+
+    def get(self, key):
+        with self._lock:
+            row = self.rows.get(key)
+            if row is None:
+                return None
+            if self._matrix is None or row >= self._matrix.shape[0]:
+                with self._locked(exclusive=False):
+                    if _inode(self.vectors_path) != self._inode:
+                        self._read()
+                    else:
+                        self._map()
+                row = self.rows.get(key)
+                if row is None or self._matrix is None or row >= self._matrix.shape[0]:
+                    return None
+            return np.array(self._matrix[row])
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if key in self.rows:
+                return
+            with self._locked(exclusive=True):
+                # Another process may have started the store over since we read it
+                if _inode(self.vectors_path) != self._inode:
+                    self._read()
+                if self.dim is None:
+                    self.dim = vector.shape[0]
+                elif vector.shape[0] != self.dim:
+                    return
+                row_size = 4 * self.dim
+                if self._inode is not None and os.path.getsize(self.vectors_path) >= self.max_entries * row_size:
+                    self._reset()
+                    self.dim = vector.shape[0]
+                with open(self.vectors_path, 'ab') as file:
+                    # The row is where the file ends once we hold the lock, whatever other processes appended
+                    end = file.seek(0, os.SEEK_END)
+                    if end % row_size:
+                        # drop a row that a crashed writer left half-written
+                        end -= end % row_size
+                        file.truncate(end)
+                    file.write(vector.tobytes())
+                with open(self.keys_path, 'a') as keys_file:
+                    keys_file.write(json.dumps({'key': key, 'row': end // row_size, 'dim': self.dim}) + "\n")
+                self._inode = _inode(self.vectors_path)
+            self.rows[key] = end // row_size
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings model with a query-embedding cache shared by all sessions.
+
+    Queries are keyed on the normalised text and the model name. Lookups go to an in-memory LRU first and
+    then to the optional on-disk store. Document embeddings are passed straight through.
+    """
+
+    def __init__(self, embeddings, model_name, max_entries=QUERY_EMBEDDING_CACHE_SIZE, cache_dir=QUERY_EMBEDDING_CACHE_DIR):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.disk_store = DiskVectorStore(os.path.join(cache_dir, model_name)) if cache_dir else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        """The cached vector as a list, or None."""
+        vector = self._get_memory(key)
+        return vector if vector is not None else self._get_disk(key)
+
+    def _get_memory(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is None:
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+    def _get_disk(self, key):
+        if self.disk_store is not None:
+            vector = self.disk_store.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector.tolist()
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, vector):
+        # A float32 array takes an eighth of the memory of the same vector as a list of floats
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _put(self, key, vector):
+        self._remember(key, vector)
+        if self.disk_store is not None:
+            self.disk_store.put(key, vector)
+
+    def embed_query(self, text):
+        key = cache_key(self.model_name, text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        # The on-disk store is read and written in a worker thread, so the event loop never waits for the disk
+        key = cache_key(self.model_name, text)
+        vector = self._get_memory(key)
+        if vector is None:
+            vector = await asyncio.to_thread(self._get_disk, key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._remember(key, vector)
+            if self.disk_store is not None:
+                await asyncio.to_thread(self.disk_store.put, key, vector)
+        return vector
+
+    def embed_queries(self, texts):
+        """Embeds many queries, with one request for all of them that are not cached yet, and caches them."""
+        keys = [cache_key(self.model_name, text) for text in texts]
+        vectors = [self._get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self.embeddings.embed_documents([texts[i] for i in missing])):
+                self._put(keys[i], vector)
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / total if total else 0.0,
+                'size': len(self._memory),
+            }
@@ -1,21 +1,98 @@
 import os
+import asyncio
+import weakref
+import threading
+import functools
+from collections import OrderedDict
+import httpx
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import tiktoken
+from helper_functions.tracing import mark_first_token, record_openai_usage
 
 
-if load_dotenv('.env'):
-   # for local development
-   OPENAI_KEY = os.getenv('OPENAI_API_KEY')
-else:
-   OPENAI_KEY = st.secrets['OPENAI_API_KEY']
+# Connection settings shared by every call to the OpenAI API
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+# The OpenAI client retries failed requests (429s, 5xx, connection errors) with exponential backoff
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+# Upper bound on concurrent upstream requests made through the async functions, across all sessions
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', '32'))
+
+
+@st.cache_resource
+def get_openai_key():
+    if load_dotenv('.env'):
+        # for local development
+        return os.getenv('OPENAI_API_KEY')
+    return st.secrets['OPENAI_API_KEY']
+
+
+# One HTTP connection pool per process, so connections to the API are kept alive across requests and sessions
+@st.cache_resource
+def get_http_client():
+    return httpx.Client(
+        timeout=OPENAI_TIMEOUT,
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+    )
+
 
 # Pass the API Key to the OpenAI Client
-client = OpenAI(api_key=OPENAI_KEY)
+@st.cache_resource
+def get_client():
+    return OpenAI(
+        api_key=get_openai_key(),
+        timeout=OPENAI_TIMEOUT,
+        max_retries=OPENAI_MAX_RETRIES,
+        http_client=get_http_client(),
+    )
+
+
+# Async clients and limiters are bound to an event loop, so there is one of each per loop.
+# The app runs all async calls on the shared loop of helper_functions.async_runner, so in practice there is one.
+_async_clients = weakref.WeakKeyDictionary()
+_request_limiters = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        if loop not in _async_clients:
+            _async_clients[loop] = AsyncOpenAI(
+                api_key=get_openai_key(),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.AsyncClient(
+                    timeout=OPENAI_TIMEOUT,
+                    limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                        max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+                ),
+            )
+        return _async_clients[loop]
+
+
+def get_request_limiter():
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        if loop not in _request_limiters:
+            _request_limiters[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return _request_limiters[loop]
+
+
+# Keyword arguments for the LangChain OpenAI classes, so they share the same key and connection pool
+def langchain_openai_kwargs():
+    return {
+        'api_key': get_openai_key(),
+        'timeout': OPENAI_TIMEOUT,
+        'max_retries': OPENAI_MAX_RETRIES,
+        'http_client': get_http_client(),
+    }
+
 
 def get_embedding(input, model='text-embedding-3-small'):
-    response = client.embeddings.create(
+    response = get_client().embeddings.create(
         input=input,
         model=model
     )
@@ -30,7 +107,7 @@ def get_completion(prompt, model="gpt-4o-mini", temperature=0, top_p=1.0, max_to
       output_json_structure = None
 
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create( #originally was openai.chat.completions
+    response = get_client().chat.completions.create( #originally was openai.chat.completions
         model=model,
         messages=messages,
         temperature=temperature,
@@ -39,12 +116,13 @@ def get_completion(prompt, model="gpt-4o-mini", temperature=0, top_p=1.0, max_to
         n=1,
         response_format=output_json_structure,
     )
+    record_openai_usage(response.usage)
     return response.choices[0].message.content
 
 
 # Note that this function directly take in "messages" as the parameter.
 def get_completion_by_messages(messages, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1):
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model=model,
         messages=messages,
         temperature=temperature,
@@ -52,19 +130,128 @@ def get_completion_by_messages(messages, model="gpt-4o-mini", temperature=0, top
         max_tokens=max_tokens,
         n=1
     )
+    record_openai_usage(response.usage)
     return response.choices[0].message.content
 
 
+# Streaming version of get_completion_by_messages: yields the text deltas as they arrive,
+# so the first words can be shown long before the full completion is generated
+def get_completion_by_messages_stream(messages, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1):
+    stream = get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+        n=1,
+        stream=True,
+        # the last chunk then carries the token usage of the whole completion
+        stream_options={"include_usage": True},
+    )
+    for chunk in stream:
+        if chunk.usage is not None:
+            record_openai_usage(chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            mark_first_token()
+            yield chunk.choices[0].delta.content
+
+
+async def aget_embedding(input, model='text-embedding-3-small'):
+    async with get_request_limiter():
+        response = await get_async_client().embeddings.create(
+            input=input,
+            model=model
+        )
+    return [x.embedding for x in response.data]
+
+
+# Async version of get_completion_by_messages
+async def aget_completion_by_messages(messages, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1):
+    async with get_request_limiter():
+        response = await get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            n=1
+        )
+    record_openai_usage(response.usage)
+    return response.choices[0].message.content
+
+
+# Async version of get_completion_by_messages_stream; the request holds its limiter slot until the stream ends
+async def aget_completion_by_messages_stream(messages, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1):
+    async with get_request_limiter():
+        stream = await get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            n=1,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                record_openai_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                mark_first_token()
+                yield chunk.choices[0].delta.content
+
+
+# The encoder is resolved once; tiktoken.encoding_for_model is far too slow to call per count
+@functools.lru_cache(maxsize=None)
+def get_encoding(model='gpt-4o-mini'):
+    return tiktoken.encoding_for_model(model)
+
+
+# LRU cache of token counts. The text splitter measures the same fragments many times while merging them into chunks
+TOKEN_COUNT_CACHE_SIZE = 8192
+_token_count_cache = OrderedDict()
+_token_count_lock = threading.Lock()
+
+
+def _cached_token_count(text):
+    with _token_count_lock:
+        count = _token_count_cache.get(text)
+        if count is not None:
+            _token_count_cache.move_to_end(text)
+        return count
+
+
+def _store_token_count(text, count):
+    with _token_count_lock:
+        _token_count_cache[text] = count
+        _token_count_cache.move_to_end(text)
+        while len(_token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+            _token_count_cache.popitem(last=False)
+
+
 # This function is for calculating the tokens given the "message"
 # ⚠️ This is simplified implementation that is good enough for a rough estimation
 def count_tokens(text):
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
-    return len(encoding.encode(text))
+    count = _cached_token_count(text)
+    if count is None:
+        count = len(get_encoding().encode(text))
+        _store_token_count(text, count)
+    return count
 
 
-def count_tokens_from_message(messages):
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
-    value = ' '.join([x.get('content') for x in messages])
-    return len(encoding.encode(value))
+# Counts the tokens of many texts at once; the texts that are not cached are encoded in one batch
+def count_tokens_many(texts):
+    texts = list(texts)
+    counts = [_cached_token_count(text) for text in texts]
+    missing = list({text for text, count in zip(texts, counts) if count is None})
+    if missing:
+        missing_counts = dict(zip(missing, (len(tokens) for tokens in get_encoding().encode_batch(missing))))
+        for text, count in missing_counts.items():
+            _store_token_count(text, count)
+        counts = [missing_counts[text] if count is None else count for text, count in zip(texts, counts)]
+    return counts
 
 
+def count_tokens_from_message(messages):
+    value = ' '.join([x.get('content') for x in messages])
+    return len(get_encoding().encode(value))
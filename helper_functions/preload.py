@@ -0,0 +1,27 @@
+import logging
+import importlib
+import threading
+import streamlit as st
+
+
+logger = logging.getLogger(__name__)
+
+
+def _load(module_name):
+    try:
+        module = importlib.import_module(module_name)
+        # A module can define preload() to build its expensive resources as well
+        if hasattr(module, 'preload'):
+            module.preload()
+    except Exception:
+        # The first request imports the module again and shows the error to the user
+        logger.exception("Preloading %s failed", module_name)
+
+
+# Imports a heavy module on a background thread, once per process, so the page renders without waiting for it.
+# A request that imports the module before the thread is done simply waits for the import to finish.
+@st.cache_resource
+def preload_in_background(module_name):
+    thread = threading.Thread(target=_load, args=(module_name,), name=f"preload-{module_name}", daemon=True)
+    thread.start()
+    return thread
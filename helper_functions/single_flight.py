@@ -0,0 +1,148 @@
+import asyncio
+import weakref
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    # Chunks of one upstream stream, replayed to every subscriber from the start
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = None
+
+
+class SingleFlight:
+    """Coalesces identical in-flight requests: concurrent callers with the same key share one call and its result.
+
+    Nothing is cached; the key is free again as soon as the call finishes. Async calls and streams are tracked
+    per event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()
+        self._broadcasts = weakref.WeakKeyDictionary()
+        self.calls = 0
+        self.coalesced = 0
+
+    def _count(self, leader):
+        if leader:
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key, coroutine_fn):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+            task = calls.get(key)
+            leader = task is None
+            if leader:
+                task = calls[key] = loop.create_task(coroutine_fn())
+                task.add_done_callback(lambda _: calls.pop(key, None))
+            self._count(leader)
+        # One caller giving up does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def astream(self, key, async_generator_fn):
+        """Like ado, for async generators: every caller gets all chunks, including those sent before it joined."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            broadcasts = self._broadcasts.setdefault(loop, {})
+            broadcast = broadcasts.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = broadcasts[key] = _Broadcast()
+                broadcast.task = loop.create_task(self._produce(broadcasts, key, broadcast, async_generator_fn()))
+            broadcast.subscribers += 1
+            self._count(leader)
+
+        position = 0
+        try:
+            while True:
+                async with broadcast.changed:
+                    await broadcast.changed.wait_for(lambda: len(broadcast.chunks) > position or broadcast.finished)
+                    chunks = broadcast.chunks[position:]
+                    finished = broadcast.finished
+                position += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if finished and position == len(broadcast.chunks):
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+        finally:
+            with self._lock:
+                broadcast.subscribers -= 1
+                abandoned = broadcast.subscribers == 0 and not broadcast.finished
+                # A caller arriving after this starts a new call instead of joining the cancelled one
+                if abandoned and broadcasts.get(key) is broadcast:
+                    del broadcasts[key]
+            # Stop the upstream call once nobody is listening any more
+            if abandoned:
+                broadcast.task.cancel()
+
+    async def _produce(self, broadcasts, key, broadcast, async_generator):
+        try:
+            async for chunk in async_generator:
+                async with broadcast.changed:
+                    broadcast.chunks.append(chunk)
+                    broadcast.changed.notify_all()
+        except Exception as e:
+            broadcast.error = e
+        except asyncio.CancelledError as e:
+            # Anyone still reading must not take the chunks so far for the whole stream
+            broadcast.error = e
+            raise
+        finally:
+            with self._lock:
+                if broadcasts.get(key) is broadcast:
+                    del broadcasts[key]
+            broadcast.finished = True
+            async with broadcast.changed:
+                broadcast.changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            total = self.calls + self.coalesced
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'coalesced_rate': self.coalesced / total if total else 0.0,
+            }
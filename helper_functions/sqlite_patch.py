@@ -0,0 +1,15 @@
+# Chroma needs a newer sqlite3 than some hosts ship with, so swap in pysqlite3 when it is installed.
+# Import this module before anything that imports chromadb.
+import sys
+try:
+    # prefer the dbapi2 alias
+    from pysqlite3 import dbapi2 as sqlite3_replacement
+    sys.modules['sqlite3'] = sqlite3_replacement
+except Exception:
+    # fallback if named differently
+    try:
+        import pysqlite3 as p
+        sys.modules['sqlite3'] = p
+    except Exception:
+        # allow normal flow; you'll see the Chroma error if replacement failed
+        pass
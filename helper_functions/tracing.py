@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# Every finished request is appended to this file as one JSON line; set TRACING_ENABLED=0 to switch it off
+TRACE_LOG_PATH = os.getenv('TRACE_LOG_PATH', './logs/traces.jsonl')
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', '1') == '1'
+# The log is rolled over to traces.jsonl.1, .2, ... once it reaches this size; older files beyond the backups are deleted
+TRACE_LOG_MAX_BYTES = int(os.getenv('TRACE_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+TRACE_LOG_BACKUPS = int(os.getenv('TRACE_LOG_BACKUPS', '3'))
+
+# Upper bounds (ms) of the in-memory latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float('inf')]
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_write_lock = threading.Lock()
+_histogram_lock = threading.Lock()
+_histograms = {}
+
+
+def _observe(stage, duration_ms):
+    with _histogram_lock:
+        counts = _histograms.setdefault(stage, [0] * len(HISTOGRAM_BUCKETS_MS))
+        counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, duration_ms)] += 1
+
+
+def get_histograms():
+    """Returns {stage: [(bucket upper bound in ms, count), ...]} for this process."""
+    with _histogram_lock:
+        return {stage: list(zip(HISTOGRAM_BUCKETS_MS, counts)) for stage, counts in _histograms.items()}
+
+
+def _rotate(path, backups):
+    for i in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    if backups > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+
+def _write(record):
+    directory = os.path.dirname(TRACE_LOG_PATH)
+    with _write_lock:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            if os.path.getsize(TRACE_LOG_PATH) >= TRACE_LOG_MAX_BYTES:
+                _rotate(TRACE_LOG_PATH, TRACE_LOG_BACKUPS)
+        except FileNotFoundError:
+            # not written yet, or another process has just rolled it over
+            pass
+        with open(TRACE_LOG_PATH, 'a') as file:
+            file.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def trace(name, **attributes):
+    """Times one request. Spans and attributes recorded inside it end up in a single JSONL record."""
+    record = {
+        'trace_id': uuid.uuid4().hex,
+        'name': name,
+        'timestamp': time.time(),
+        'spans': {},
+        'attributes': dict(attributes),
+    }
+    token = _current_trace.set(record)
+    record['_start'] = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record['attributes']['error'] = type(e).__name__
+        raise
+    finally:
+        record['total_ms'] = (time.perf_counter() - record.pop('_start')) * 1000
+        _current_trace.reset(token)
+        _observe(f"{name}.total", record['total_ms'])
+        if TRACING_ENABLED:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                _write(record)
+            else:
+                # On an event loop the file is written by a worker thread, so other requests are not held up
+                loop.run_in_executor(None, _write, record)
+
+
+@contextmanager
+def span(stage):
+    """Times one stage of the current request; repeated stages add up."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        record = _current_trace.get()
+        if record is not None:
+            record['spans'][stage] = record['spans'].get(stage, 0.0) + duration_ms
+            _observe(f"{record['name']}.{stage}", duration_ms)
+        else:
+            _observe(stage, duration_ms)
+
+
+def set_attributes(**attributes):
+    record = _current_trace.get()
+    if record is not None:
+        record['attributes'].update(attributes)
+
+
+# Time to first token, measured from the start of the request
+def mark_first_token():
+    record = _current_trace.get()
+    if record is not None and 'ttft_ms' not in record:
+        record['ttft_ms'] = (time.perf_counter() - record['_start']) * 1000
+
+
+def record_tokens(input_tokens=0, output_tokens=0, cached_tokens=0):
+    record = _current_trace.get()
+    if record is None:
+        return
+    attributes = record['attributes']
+    attributes['input_tokens'] = attributes.get('input_tokens', 0) + (input_tokens or 0)
+    attributes['output_tokens'] = attributes.get('output_tokens', 0) + (output_tokens or 0)
+    attributes['cached_tokens'] = attributes.get('cached_tokens', 0) + (cached_tokens or 0)
+
+
+def record_openai_usage(usage):
+    # `usage` field of an OpenAI chat completion (or of the last chunk of a stream with include_usage)
+    if usage is None:
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    record_tokens(usage.prompt_tokens, usage.completion_tokens, getattr(details, 'cached_tokens', 0) if details else 0)
+
+
+def record_langchain_usage(message):
+    # `usage_metadata` of a LangChain AIMessage, or of the last AIMessageChunk when streaming with stream_usage=True
+    usage = getattr(message, 'usage_metadata', None)
+    if not usage:
+        return
+    details = usage.get('input_token_details') or {}
+    record_tokens(usage.get('input_tokens', 0), usage.get('output_tokens', 0), details.get('cache_read', 0))
+
+
+def _tail_lines(path, limit, block_size=64 * 1024):
+    # Reads blocks from the end of the file until it has `limit` complete lines, or reaches the start
+    with open(path, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        data = b''
+        while position > 0 and data.count(b"\n") <= limit:
+            step = min(block_size, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+    lines = data.splitlines()
+    if position > 0:
+        # the first line is probably cut off
+        lines = lines[1:]
+    return lines[-limit:] if limit else []
+
+
+def load_records(path=TRACE_LOG_PATH, limit=10000):
+    """Reads the last `limit` trace records, from the end of the log and, if needed, its rolled-over files."""
+    lines = []
+    for file_path in [path] + [f"{path}.{i}" for i in range(1, TRACE_LOG_BACKUPS + 1)]:
+        if len(lines) >= limit:
+            break
+        if os.path.exists(file_path):
+            lines = _tail_lines(file_path, limit - len(lines)) + lines
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return records
+
+
+def percentile(values, q):
+    """The q-th percentile, interpolated linearly between the two nearest samples; used by the benchmarks too."""
+    values = sorted(values)
+    if not values:
+        return None
+    position = q / 100 * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(records):
+    """Per request type and stage: count and p50/p90/p99 latency in ms."""
+    samples = {}
+    for record in records:
+        name = record['name']
+        samples.setdefault((name, 'total'), []).append(record['total_ms'])
+        if record.get('ttft_ms') is not None:
+            samples.setdefault((name, 'time to first token'), []).append(record['ttft_ms'])
+        for stage, duration_ms in record['spans'].items():
+            samples.setdefault((name, stage), []).append(duration_ms)
+    return [{
+        'request': name,
+        'stage': stage,
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50), 1),
+        'p90_ms': round(percentile(values, 90), 1),
+        'p99_ms': round(percentile(values, 99), 1),
+    } for (name, stage), values in sorted(samples.items())]
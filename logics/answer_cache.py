@@ -0,0 +1,185 @@
+import os
+import time
+import sqlite3
+import threading
+import numpy as np
+from helper_functions.embedding_cache import normalise_query
+
+
+ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH', './vector_db/answer_cache.sqlite3')
+# A new question reuses a stored answer when its cosine distance to the stored question is at most this value
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv('ANSWER_CACHE_MAX_DISTANCE', '0.05'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000'))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+SCHEMA_VERSION = 2
+
+
+class AnswerCache:
+    """Persistent cache of answers, looked up by the embedding of the question.
+
+    Answers are only reused for the index version they were generated from.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_distance=ANSWER_CACHE_MAX_DISTANCE,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # One connection shared by all Streamlit sessions, guarded by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # The file is only a cache, so an older layout is simply dropped and rebuilt
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS answers")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                index_version TEXT NOT NULL,
+                question TEXT NOT NULL,
+                question_key TEXT NOT NULL,
+                embedding BLOB,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_version ON answers (index_version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_question ON answers (index_version, question_key)")
+        self._conn.commit()
+
+        # In-memory copy of the (normalised) embeddings per index version, so a lookup is one matrix product. It is
+        # kept up to date with this process's writes, and with other processes' through PRAGMA data_version
+        self._matrix_cache = {}
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load_matrix(self, index_version):
+        # data_version changes when another connection commits, i.e. another process stored or evicted answers
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            for version in list(self._matrix_cache):
+                self._sync_matrix(version)
+        if index_version not in self._matrix_cache:
+            self._matrix_cache[index_version] = ([], np.empty((0, 0), dtype=np.float32))
+            self._sync_matrix(index_version)
+        return self._matrix_cache[index_version]
+
+    def _sync_matrix(self, index_version):
+        # Drops the answers that are gone and appends the new ones; embeddings already loaded are not read again
+        loaded = set(self._matrix_cache[index_version][0])
+        current = {row[0] for row in self._conn.execute(
+            "SELECT id FROM answers WHERE index_version = ? AND embedding IS NOT NULL", (index_version,))}
+        self._remove_ids(index_version, loaded - current)
+        missing = sorted(current - loaded)
+        for start in range(0, len(missing), 500):
+            batch = missing[start:start + 500]
+            rows = self._conn.execute(f"SELECT id, embedding FROM answers WHERE id IN ({','.join('?' * len(batch))})",
+                                      batch).fetchall()
+            self._append(index_version, [row[0] for row in rows], [np.frombuffer(row[1], dtype=np.float32) for row in rows])
+
+    def _append(self, index_version, new_ids, vectors):
+        if not new_ids:
+            return
+        ids, matrix = self._matrix_cache[index_version]
+        rows = np.vstack(vectors)
+        if len(ids) == 0:
+            matrix = rows
+        elif matrix.shape[1] != rows.shape[1]:
+            # embeddings of another model cannot be compared; keep the newer ones
+            ids, matrix = [], rows
+        else:
+            matrix = np.vstack([matrix, rows])
+        self._matrix_cache[index_version] = (ids + list(new_ids), matrix)
+
+    def _remove_ids(self, index_version, removed):
+        ids, matrix = self._matrix_cache[index_version]
+        if not removed or not ids:
+            return
+        keep = [i for i, id in enumerate(ids) if id not in removed]
+        self._matrix_cache[index_version] = ([ids[i] for i in keep], matrix[keep])
+
+    def _evict(self, now):
+        # Drop expired answers first, then the least recently used ones above the size limit
+        removed = [row[0] for row in self._conn.execute("""
+            SELECT id FROM answers WHERE created_at < ? OR id NOT IN (
+                SELECT id FROM answers ORDER BY last_used_at DESC LIMIT ?
+            )""", (now - self.ttl_seconds, self.max_entries))]
+        self._conn.executemany("DELETE FROM answers WHERE id = ?", [(id,) for id in removed])
+        self._conn.commit()
+        for version in self._matrix_cache:
+            self._remove_ids(version, set(removed))
+
+    def _hit(self, id, answer, now):
+        self._conn.execute("UPDATE answers SET last_used_at = ? WHERE id = ?", (now, id))
+        self._conn.commit()
+        self.hits += 1
+        return answer
+
+    def lookup(self, query_embedding, index_version):
+        query = _normalise(query_embedding)
+        now = time.time()
+        with self._lock:
+            ids, matrix = self._load_matrix(str(index_version))
+            if len(ids) > 0 and matrix.shape[1] == query.shape[0]:
+                distances = 1.0 - matrix @ query
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    row = self._conn.execute(
+                        "SELECT answer, created_at FROM answers WHERE id = ?", (ids[best],)).fetchone()
+                    if row is not None and row[1] >= now - self.ttl_seconds:
+                        return self._hit(ids[best], row[0], now)
+            self.misses += 1
+            return None
+
+    def lookup_exact(self, question, index_version):
+        # Lookup by the normalised question text only, for questions that are answered without an embedding
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer FROM answers WHERE index_version = ? AND question_key = ? AND created_at >= ? "
+                "ORDER BY last_used_at DESC LIMIT 1",
+                (str(index_version), normalise_query(question), now - self.ttl_seconds)).fetchone()
+            if row is not None:
+                return self._hit(row[0], row[1], now)
+            self.misses += 1
+            return None
+
+    def store(self, question, query_embedding, answer, index_version):
+        # query_embedding may be None, in which case the answer can only be found again with lookup_exact
+        embedding = _normalise(query_embedding).tobytes() if query_embedding is not None else None
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers (index_version, question, question_key, embedding, answer, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(index_version), question, normalise_query(question), embedding, answer, now, now))
+            if embedding is not None and str(index_version) in self._matrix_cache:
+                self._append(str(index_version), [cursor.lastrowid], [np.frombuffer(embedding, dtype=np.float32)])
+            self._evict(now)
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._matrix_cache.clear()
+
+
+def _normalise(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
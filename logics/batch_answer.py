@@ -0,0 +1,194 @@
+"""Offline question answering over a JSONL file.
+
+    python -m logics.batch_answer questions.jsonl answers.jsonl --workers 8
+
+Each input line is a JSON object with a "question", and optionally an "id" and an "advisor" ("advisor" for the
+energy saving advisor, "eligibility" for the product checker; --advisor sets the default). Questions are
+deduplicated on their normalised text. For each batch of advisor questions the uncached ones are embedded in
+one request and searched in one pass, then the LLM calls go through a bounded worker pool.
+
+Every answer is appended to the output as soon as it is ready, so an interrupted run is resumed by running the
+same command again. Questions that failed are left out of the output and retried on the next run. The answer
+cache is neither read nor written, so every answer is generated fresh.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_core.documents import Document
+from helper_functions.embedding_cache import normalise_query
+from helper_functions.tracing import record_langchain_usage
+
+
+ADVISORS = ['advisor', 'eligibility']
+BATCH_SIZE = 256
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+
+
+def dedupe_key(advisor, question):
+    return hashlib.sha256(f"{advisor}\n{normalise_query(question)}".encode('utf-8')).hexdigest()
+
+
+def read_questions(path, default_advisor):
+    """Reads the input file line by line; returns {key: record} with the ids of all duplicates merged."""
+    questions = {}
+    with open(path, 'r') as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            advisor = record.get('advisor', default_advisor)
+            if advisor not in ADVISORS:
+                raise ValueError(f"Line {line_number}: unknown advisor {advisor!r}")
+            key = dedupe_key(advisor, record['question'])
+            entry = questions.setdefault(key, {'key': key, 'advisor': advisor, 'question': record['question'], 'ids': []})
+            entry['ids'].append(record.get('id', line_number))
+    return questions
+
+
+def load_done_keys(path):
+    """Keys of the questions already answered in `path`; a line cut off by an interruption is removed."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as file:
+        data = file.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            file.truncate(complete)
+    return {json.loads(line)['key'] for line in data[:complete].decode('utf-8').splitlines() if line.strip()}
+
+
+def batch_vector_search(vectorstore, query_embeddings, k):
+    """Vector search for many query embeddings at once; returns a list of (document, relevance score) lists."""
+    if hasattr(vectorstore, 'similarity_search_by_vectors_with_relevance_scores'):
+        return vectorstore.similarity_search_by_vectors_with_relevance_scores(query_embeddings, k)
+    # Chroma takes many query embeddings in one call
+    results = vectorstore._collection.query(query_embeddings=query_embeddings, n_results=k,
+                                            include=["documents", "metadatas", "distances"])
+    relevance = vectorstore._select_relevance_score_fn()
+    return [[(Document(id=id, page_content=text, metadata=metadata or {}), relevance(distance))
+             for id, text, metadata, distance in zip(ids, texts, metadatas, distances)]
+            for ids, texts, metadatas, distances in zip(results["ids"], results["documents"],
+                                                         results["metadatas"], results["distances"])]
+
+
+def retrieve_batch(questions, vectordb, index_version):
+    """Context documents for each question, with the same retriever settings as the app."""
+    from logics import query_handler
+    from logics.hybrid_retriever import HybridRetriever
+    from logics.context_builder import build_context
+
+    hybrid = query_handler.RETRIEVER_MODE == 'hybrid'
+    retriever = HybridRetriever(vectorstore=vectordb, lexical_index=query_handler.get_lexical_index(vectordb, index_version),
+                                score_threshold=query_handler.SCORE_THRESHOLD)
+    documents = {}
+    lexical_results = {}
+    semantic = []
+    for question in questions:
+        if hybrid:
+            lexical_results[question] = retriever.lexical_index.search(question, k=retriever.fetch_k)
+            if retriever.lexical_index.is_confident(question, lexical_results[question]):
+                documents[question] = retriever.lexical_only(question, lexical_results[question])
+                continue
+        semantic.append(question)
+
+    if semantic:
+        embeddings = query_handler.embeddings_model.embed_queries(semantic)
+        k = retriever.fetch_k if hybrid else retriever.k
+        for question, vector_results in zip(semantic, batch_vector_search(vectordb, embeddings, k)):
+            if hybrid:
+                documents[question] = retriever.fuse_with_vector_results(question, vector_results,
+                                                                         lexical_results[question])
+            else:
+                documents[question] = [document for document, score in vector_results
+                                       if score >= query_handler.SCORE_THRESHOLD]
+    return {question: build_context(documents[question], question) for question in questions}
+
+
+def prepare(entries, batch_size):
+    """Yields (entry, job) pairs, where job() returns the answer; retrieval is done a batch at a time."""
+    from logics import query_handler
+    from logics.product_handler import identify_product_category
+
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        advisor_questions = [entry['question'] for entry in batch if entry['advisor'] == 'advisor']
+        if advisor_questions:
+            vectordb, index_version = query_handler.live_index.get()
+            contexts = retrieve_batch(advisor_questions, vectordb, index_version)
+        for entry in batch:
+            if entry['advisor'] == 'advisor':
+                entry['index_version'] = index_version
+                prompt = query_handler.build_prompt(entry['question'], contexts[entry['question']])
+                yield entry, lambda prompt=prompt: complete(query_handler.llm, prompt)
+            else:
+                yield entry, lambda question=entry['question']: identify_product_category(question)
+
+
+def complete(llm, prompt):
+    response = llm.invoke(prompt)
+    record_langchain_usage(response)
+    return response.content
+
+
+def answer_file(input_path, output_path, default_advisor='advisor', batch_size=BATCH_SIZE, max_workers=BATCH_WORKERS):
+    questions = read_questions(input_path, default_advisor)
+    done = load_done_keys(output_path)
+    entries = [entry for key, entry in questions.items() if key not in done]
+    print(f"{len(questions)} unique questions, {len(questions) - len(entries)} already answered, "
+          f"{len(entries)} to go.", file=sys.stderr)
+
+    answered = failed = 0
+    start = time.perf_counter()
+    with open(output_path, 'a') as output, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+
+        def collect(return_when):
+            nonlocal answered, failed
+            finished, _ = wait(pending, return_when=return_when)
+            for future in finished:
+                entry = pending.pop(future)
+                try:
+                    entry['answer'] = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to answer {entry['question']!r}: {e}", file=sys.stderr)
+                    continue
+                output.write(json.dumps(entry) + "\n")
+                output.flush()
+                answered += 1
+                if answered % 100 == 0:
+                    rate = answered / (time.perf_counter() - start) * 3600
+                    print(f"{answered}/{len(entries)} answered, {rate:.0f} per hour", file=sys.stderr)
+
+        # A few jobs beyond the pool size are queued, so workers never wait for the next batch to be retrieved
+        for entry, job in prepare(entries, batch_size):
+            pending[pool.submit(job)] = entry
+            if len(pending) >= 2 * max_workers:
+                collect(FIRST_COMPLETED)
+        if pending:
+            collect('ALL_COMPLETED')
+
+    elapsed = time.perf_counter() - start
+    print(f"Answered {answered} questions in {elapsed:.1f} s, {failed} failed.", file=sys.stderr)
+    return {'answered': answered, 'failed': failed, 'skipped': len(questions) - len(entries)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions offline.")
+    parser.add_argument('input')
+    parser.add_argument('output', help="JSONL file the answers are appended to; rerun to resume")
+    parser.add_argument('--advisor', choices=ADVISORS, default='advisor', help="for lines without an \"advisor\"")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="questions embedded and retrieved at a time")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help="concurrent LLM calls")
+    args = parser.parse_args(argv)
+
+    result = answer_file(args.input, args.output, args.advisor, args.batch_size, args.workers)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Offline index build.
+
+Builds a versioned Chroma index from the files in `filename_list` and points the app at it:
+
+    python -m logics.build_index
+
+The serving app only opens the index that `vector_db/CURRENT` refers to, so this can run in CI
+and the resulting `vector_db/` directory can be shipped to every replica.
+"""
+import helper_functions.sqlite_patch
+import os
+import sys
+import shutil
+import argparse
+from datetime import datetime, timezone
+from langchain_chroma import Chroma
+from logics.embedding_pipeline import BatchedEmbeddings, EmbeddingCheckpoint, EMBEDDING_MAX_WORKERS, openai_embed_fn
+from logics.ingestion import (filename_list, get_text_splitter, hash_file, index_settings, load_manifest,
+                              sync_vector_store)
+from logics.numpy_store import export_numpy_index
+from logics.index_store import (INDEX_ROOT, COLLECTION_NAME, BUILD_INFO_FILENAME, compute_index_version,
+                                version_dir, read_current_version, write_current_version, read_build_info,
+                                write_build_info)
+
+
+def is_compatible(path):
+    """Whether the index at `path` was built with the current chunking and embedding settings."""
+    try:
+        build_info = read_build_info(path)
+    except (OSError, ValueError):
+        return False
+    return all(build_info.get(key) == value for key, value in index_settings().items())
+
+
+def build_index(data_dir='data', index_root=INDEX_ROOT, batch_size=1000, max_workers=EMBEDDING_MAX_WORKERS,
+                activate=True, embed_fn=None):
+    file_hashes = {}
+    for filename in filename_list:
+        file_hashes[filename] = hash_file(os.path.join(data_dir, filename))
+
+    settings = index_settings()
+    version = compute_index_version(file_hashes, **settings)
+    target = version_dir(version, index_root)
+
+    if os.path.exists(os.path.join(target, BUILD_INFO_FILENAME)):
+        print(f"Index {version} is already built.")
+    else:
+        # Build into a staging directory, so a failed build never leaves a half-written version behind
+        staging = target + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+
+        # Start from a copy of the current version, so only new or changed chunks are embedded; its vectors are
+        # only reusable if it was chunked and embedded with the same settings
+        previous = read_current_version(index_root)
+        if previous is not None and is_compatible(version_dir(previous, index_root)):
+            shutil.copytree(version_dir(previous, index_root), staging)
+
+        # Finished embeddings are checkpointed outside the staging directory, so a rerun after an interruption
+        # only embeds what is still missing
+        checkpoint = EmbeddingCheckpoint(target + ".checkpoint.jsonl")
+        embeddings = BatchedEmbeddings(embed_fn or openai_embed_fn(settings['embedding_model']), checkpoint=checkpoint,
+                                       max_workers=max_workers)
+
+        vectordb = Chroma(
+            collection_name = COLLECTION_NAME,
+            embedding_function = embeddings,
+            persist_directory = staging)
+        stats = sync_vector_store(vectordb, get_text_splitter(), filename_list, staging,
+                                  data_dir=data_dir, batch_size=batch_size)
+        # sync_vector_store skips files it cannot load; a version missing part of its corpus must not be served
+        missing = [filename for filename in filename_list if os.path.join(data_dir, filename) not in load_manifest(staging)]
+        if missing:
+            raise RuntimeError(f"Could not ingest {missing}, index {version} was not activated")
+        print(f"Built index {version}: {stats}")
+
+        # The same vectors as a plain matrix, for the exact NumPy search backend
+        export_numpy_index(vectordb, staging)
+
+        write_build_info(staging, {
+            'version': version,
+            'collection_name': COLLECTION_NAME,
+            'files': file_hashes,
+            **settings,
+            'num_chunks': stats['added'] + stats['kept'],
+            'built_at': datetime.now(timezone.utc).isoformat(),
+        })
+        os.replace(staging, target)
+        checkpoint.remove()
+
+    if activate:
+        write_current_version(version, index_root)
+        print(f"Serving index {version}.")
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the versioned vector index for the WattSaver advisor.")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--index-root', default=INDEX_ROOT)
+    parser.add_argument('--batch-size', type=int, default=1000, help="number of chunks written to the collection at a time")
+    parser.add_argument('--workers', type=int, default=EMBEDDING_MAX_WORKERS, help="number of concurrent embedding requests")
+    parser.add_argument('--no-activate', action='store_true', help="build the version without pointing the app at it")
+    args = parser.parse_args(argv)
+
+    build_index(args.data_dir, args.index_root, args.batch_size, args.workers, activate=not args.no_activate)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import os
+import re
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from helper_functions.llm import count_tokens
+from logics.product_matcher import tokenize
+
+
+# Maximum number of tokens of retrieved context put into the RAG prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+# When a chunk does not fit the remaining budget, keep its most relevant sentences instead of dropping it
+CONTEXT_TRIM_SENTENCES = os.getenv('CONTEXT_TRIM_SENTENCES', '1') == '1'
+# Chunks shorter than this are not worth adding once the budget is nearly used up
+MIN_CHUNK_TOKENS = 20
+
+
+def strip_overlap(previous, text, min_chars=20, max_chars=400):
+    # Neighbouring chunks from the splitter share their boundary text (chunk_overlap), in either order;
+    # drop the shared part from the chunk that is added later
+    for size in range(min(len(previous), len(text), max_chars), min_chars - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:].lstrip()
+        if text.endswith(previous[:size]):
+            return text[:-size].rstrip()
+    return text
+
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+|\n+", text) if sentence.strip()]
+
+
+def trim_to_budget(text, query, budget):
+    """Keeps the sentences sharing the most words with the query, in their original order, within the budget."""
+    query_terms = set(tokenize(query))
+    sentences = split_sentences(text)
+    ranked = sorted(range(len(sentences)),
+                    key=lambda i: len(query_terms.intersection(tokenize(sentences[i]))), reverse=True)
+    keep, used = set(), 0
+    for i in ranked:
+        if not query_terms.intersection(tokenize(sentences[i])):
+            break
+        tokens = count_tokens(sentences[i])
+        if used + tokens <= budget:
+            keep.add(i)
+            used += tokens
+    return ' '.join(sentences[i] for i in sorted(keep))
+
+
+def build_context(documents, query, budget=CONTEXT_TOKEN_BUDGET, trim_sentences=CONTEXT_TRIM_SENTENCES):
+    """Orders the chunks by score, removes duplicate and overlapping text, and packs them into the token budget."""
+    # sorted() is stable, so chunks without a score keep the retriever's order
+    ranked = sorted(documents, key=lambda document: document.metadata.get('score', 0.0), reverse=True)
+
+    packed = []
+    seen = set()
+    used = 0
+    for document in ranked:
+        text = document.page_content
+        if text in seen:
+            continue
+        seen.add(text)
+        for previous in packed:
+            if previous.metadata.get('source') == document.metadata.get('source'):
+                text = strip_overlap(previous.page_content, text)
+
+        remaining = budget - used
+        if remaining < MIN_CHUNK_TOKENS:
+            break
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            if not trim_sentences:
+                continue
+            text = trim_to_budget(text, query, remaining)
+            if not text:
+                continue
+            tokens = count_tokens(text)
+        packed.append(Document(id=document.id, page_content=text, metadata=document.metadata))
+        used += tokens
+    return packed
+
+
+class BudgetedRetriever(BaseRetriever):
+    """Wraps a retriever so that the documents it returns fit the context token budget."""
+
+    retriever: Any
+    budget: int = CONTEXT_TOKEN_BUDGET
+    trim_sentences: bool = CONTEXT_TRIM_SENTENCES
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return build_context(self.retriever.invoke(query), query, self.budget, self.trim_sentences)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return build_context(await self.retriever.ainvoke(query), query, self.budget, self.trim_sentences)
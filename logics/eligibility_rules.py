@@ -0,0 +1,104 @@
+"""Eligibility rules of the Climate Vouchers under the Climate Friendly Households Programme.
+
+The rules are data: which households can claim the vouchers, and what an eligible household can still claim
+given the vouchers it has already claimed. They are compiled once into a table over every combination of
+inputs, so a check is one dictionary lookup and a file of households is one join.
+
+Screen a CSV of households offline (columns residential_status, property_type, claimed_300, claimed_100):
+
+    python -m logics.eligibility_rules households.csv --output screened.csv
+
+tests/test_eligibility_rules.py checks the compiled table over the whole input space.
+"""
+import sys
+import argparse
+import itertools
+from collections import namedtuple
+
+
+RESIDENTIAL_STATUSES = ["Singapore Citizen", "Permanent Resident", "Others"]
+PROPERTY_TYPES = ["HDB", "Private Residential Property"]
+CLAIMED_OPTIONS = ["Yes", "No"]
+
+# Households that can claim the vouchers, by (residential status, property type); nobody else can
+ELIGIBLE_HOUSEHOLDS = {
+    ("Singapore Citizen", "HDB"),
+    ("Singapore Citizen", "Private Residential Property"),
+    ("Permanent Resident", "HDB"),
+}
+
+NOT_ELIGIBLE_MESSAGE = "You are not eligible for the Climate Vouchers."
+# What an eligible household can still claim, by (claimed the 300 SGD vouchers, claimed the 100 SGD vouchers)
+CLAIM_MESSAGES = {
+    ("No", "No"): "You are eligible for both the 300 SGD and 100 SGD Climate Vouchers.",
+    ("No", "Yes"): "You are eligible for the 300 SGD Climate Vouchers.",
+    ("Yes", "No"): "You are eligible for the 100 SGD Climate Vouchers.",
+    ("Yes", "Yes"): "You have claimed all of the Climate Vouchers!",
+}
+
+INPUT_COLUMNS = ['residential_status', 'property_type', 'claimed_300', 'claimed_100']
+
+Eligibility = namedtuple('Eligibility', ['eligible_300', 'eligible_100', 'message'])
+
+
+def apply_rules(residential_status, property_type, claimed_300, claimed_100):
+    if (residential_status, property_type) not in ELIGIBLE_HOUSEHOLDS:
+        return Eligibility(False, False, NOT_ELIGIBLE_MESSAGE)
+    return Eligibility(claimed_300 == "No", claimed_100 == "No", CLAIM_MESSAGES[(claimed_300, claimed_100)])
+
+
+def compile_table():
+    return {inputs: apply_rules(*inputs)
+            for inputs in itertools.product(RESIDENTIAL_STATUSES, PROPERTY_TYPES, CLAIMED_OPTIONS, CLAIMED_OPTIONS)}
+
+
+ELIGIBILITY_TABLE = compile_table()
+
+
+def check_eligibility(residential_status, property_type, claimed_300, claimed_100):
+    """Returns the Eligibility of one household; the claimed flags are "Yes" or "No"."""
+    try:
+        return ELIGIBILITY_TABLE[(residential_status, property_type, claimed_300, claimed_100)]
+    except KeyError:
+        raise ValueError(f"Unknown input {(residential_status, property_type, claimed_300, claimed_100)}") from None
+
+
+def check_eligibility_bulk(households):
+    """Screens a DataFrame of households in one pass.
+
+    `households` needs the INPUT_COLUMNS. Returns a copy with eligible_300, eligible_100 and message added, and
+    a `valid` column that is False for rows whose inputs are not one of the known options (after stripping
+    whitespace); those rows are not eligible and have no message.
+    """
+    import pandas as pd
+
+    table = pd.DataFrame([(*inputs, *result) for inputs, result in ELIGIBILITY_TABLE.items()],
+                         columns=INPUT_COLUMNS + list(Eligibility._fields))
+    keys = households[INPUT_COLUMNS].astype(str).apply(lambda column: column.str.strip())
+    screened = keys.merge(table, on=INPUT_COLUMNS, how='left', indicator=True)
+
+    result = households.copy()
+    result['valid'] = (screened['_merge'] == 'both').to_numpy()
+    result['eligible_300'] = screened['eligible_300'].eq(True).to_numpy()
+    result['eligible_100'] = screened['eligible_100'].eq(True).to_numpy()
+    result['message'] = screened['message'].to_numpy()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen households for Climate Vouchers eligibility.")
+    parser.add_argument('input', help=f"CSV file with the columns {', '.join(INPUT_COLUMNS)}")
+    parser.add_argument('--output', help="CSV file to write the results to, instead of stdout")
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+    screened = check_eligibility_bulk(pd.read_csv(args.input, dtype=str, keep_default_na=False))
+    screened.to_csv(args.output or sys.stdout, index=False)
+    invalid = int((~screened['valid']).sum())
+    if invalid:
+        print(f"{invalid} rows have unknown inputs and were not screened.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
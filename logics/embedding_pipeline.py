@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
+from langchain_core.embeddings import Embeddings
+from helper_functions.llm import get_client, count_tokens_many
+
+
+# Limits of the OpenAI embeddings endpoint: at most 2048 inputs and 300k tokens per request, 8191 tokens per input
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '2048'))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv('EMBEDDING_MAX_BATCH_TOKENS', '300000'))
+EMBEDDING_MAX_WORKERS = int(os.getenv('EMBEDDING_MAX_WORKERS', '4'))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '8'))
+EMBEDDING_INITIAL_BACKOFF = 1.0
+EMBEDDING_MAX_BACKOFF = 60.0
+
+
+def openai_embed_fn(model='text-embedding-3-small'):
+    # Retries are handled by the pipeline, which backs off across all workers, so the client must not retry as well
+    client = get_client().with_options(max_retries=0)
+
+    def embed(texts):
+        response = client.embeddings.create(input=texts, model=model)
+        return [x.embedding for x in response.data]
+    return embed
+
+
+def make_batches(token_counts, max_batch_size=EMBEDDING_MAX_BATCH_SIZE, max_batch_tokens=EMBEDDING_MAX_BATCH_TOKENS):
+    """Groups the indices of the texts into batches that stay within both request limits."""
+    batches = []
+    batch, batch_tokens = [], 0
+    for i, tokens in enumerate(token_counts):
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _is_rate_limit(error):
+    return isinstance(error, openai.RateLimitError) or getattr(error, 'status_code', None) == 429
+
+
+def _retry_after(error):
+    # Honour the Retry-After header of a 429 when there is one
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class EmbeddingCheckpoint:
+    """Append-only JSONL file of finished embeddings, keyed by the hash of the text.
+
+    An interrupted build reloads it and only embeds what is missing. The file is read once, on the first lookup,
+    and each entry is dropped from memory once it has been handed out; what this build appends is never read back,
+    since the caller already has it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def load(self):
+        embeddings = {}
+        if not os.path.exists(self.path):
+            return embeddings
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be cut short if the build was killed while writing it
+                    continue
+                embeddings[record['key']] = record['embedding']
+        return embeddings
+
+    def lookup(self, keys):
+        """The checkpointed embeddings of those of `keys` that an earlier run finished."""
+        with self._lock:
+            if self._loaded is None:
+                self._loaded = self.load()
+            return {key: self._loaded.pop(key) for key in keys if key in self._loaded}
+
+    def append(self, records):
+        with self._lock:
+            with open(self.path, 'a') as file:
+                for key, embedding in records:
+                    file.write(json.dumps({'key': key, 'embedding': embedding}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    def remove(self):
+        with self._lock:
+            self._loaded = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def embed_texts(texts, embed_fn, checkpoint=None, max_workers=EMBEDDING_MAX_WORKERS,
+                max_batch_size=EMBEDDING_MAX_BATCH_SIZE, max_batch_tokens=EMBEDDING_MAX_BATCH_TOKENS,
+                max_retries=EMBEDDING_MAX_RETRIES):
+    """Embeds the texts in token-limited batches on a bounded thread pool.
+
+    `embed_fn` takes a list of texts and returns their embeddings in the same order; any function with that
+    signature can be used, e.g. a local fake for testing.
+    """
+    keys = [text_key(text) for text in texts]
+    done = checkpoint.lookup(keys) if checkpoint is not None else {}
+
+    # Each distinct text is embedded once, and texts from an earlier, interrupted run are not embedded again
+    todo = {}
+    for key, text in zip(keys, texts):
+        if key not in done:
+            todo.setdefault(key, text)
+    todo_keys = list(todo.keys())
+    todo_texts = list(todo.values())
+
+    # When one worker hits a rate limit, all workers wait until this time before sending another request
+    state = {'resume_at': 0.0}
+    state_lock = threading.Lock()
+
+    def run_batch(batch):
+        batch_texts = [todo_texts[i] for i in batch]
+        backoff = EMBEDDING_INITIAL_BACKOFF
+        for attempt in range(max_retries + 1):
+            with state_lock:
+                wait = state['resume_at'] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return batch, embed_fn(batch_texts)
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt == max_retries:
+                    raise
+                delay = _retry_after(e) or backoff * (1 + random.random())
+                with state_lock:
+                    state['resume_at'] = max(state['resume_at'], time.monotonic() + delay)
+                backoff = min(backoff * 2, EMBEDDING_MAX_BACKOFF)
+
+    if todo_texts:
+        batches = make_batches(count_tokens_many(todo_texts), max_batch_size, max_batch_tokens)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(run_batch, batch) for batch in batches]
+            try:
+                for future in as_completed(futures):
+                    batch, embeddings = future.result()
+                    records = [(todo_keys[i], embedding) for i, embedding in zip(batch, embeddings)]
+                    done.update(records)
+                    # Checkpoint every finished batch, so an interrupted build resumes from here
+                    if checkpoint is not None:
+                        checkpoint.append(records)
+            except BaseException:
+                # Do not start the remaining batches once one has failed for good
+                for future in futures:
+                    future.cancel()
+                raise
+
+    return [done[key] for key in keys]
+
+
+class BatchedEmbeddings(Embeddings):
+    """LangChain embeddings that run documents through embed_texts, so they can be passed to Chroma."""
+
+    def __init__(self, embed_fn, checkpoint=None, max_workers=EMBEDDING_MAX_WORKERS):
+        self.embed_fn = embed_fn
+        self.checkpoint = checkpoint
+        self.max_workers = max_workers
+
+    def embed_documents(self, texts):
+        return embed_texts(texts, self.embed_fn, checkpoint=self.checkpoint, max_workers=self.max_workers)
+
+    def embed_query(self, text):
+        return self.embed_fn([text])[0]
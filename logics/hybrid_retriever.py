@@ -0,0 +1,147 @@
+import os
+import math
+from collections import Counter
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from logics.product_matcher import tokenize
+
+
+# A query of at most this many terms, all found in one chunk, is answered from the lexical index alone
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv('LEXICAL_MAX_QUERY_TERMS', '4'))
+# Weight of the vector score when fusing it with the (max-normalised) BM25 score
+VECTOR_WEIGHT = float(os.getenv('HYBRID_VECTOR_WEIGHT', '0.5'))
+# BM25 score per query term that makes a chunk a lexical match on its own: it is kept even if it fails the vector
+# score threshold, and a short query whose terms all occur in it needs no semantic search. Terms found in most
+# chunks score close to zero, so a match on them alone never reaches it.
+LEXICAL_MIN_SCORE = float(os.getenv('LEXICAL_MIN_SCORE', '1.0'))
+
+STOPWORDS = {
+    'a', 'about', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by', 'can', 'could', 'do', 'doe', 'for',
+    'from', 'get', 'give', 'how', 'i', 'if', 'in', 'into', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'our', 'should',
+    'so', 'some', 'that', 'the', 'their', 'them', 'there', 'these', 'thi', 'to', 'tip', 'up', 'wa', 'we', 'what',
+    'when', 'where', 'which', 'who', 'why', 'will', 'with', 'would', 'you', 'your',
+}
+
+
+def load_chunks(vectordb):
+    # The chunks stored in the collection were produced by the index build's text_splitter, so building the
+    # lexical index from them keeps both views of the corpus identical
+    stored = vectordb.get(include=["documents", "metadatas"])
+    return [Document(id=id, page_content=text, metadata=metadata or {})
+            for id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])]
+
+
+class BM25Index:
+    """Compact in-memory inverted index with BM25 scoring."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        # term -> list of (document index, term frequency)
+        self.postings = {}
+        self.doc_lengths = []
+        for i, document in enumerate(documents):
+            terms = [term for term in tokenize(document.page_content) if term not in STOPWORDS]
+            self.doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings.setdefault(term, []).append((i, frequency))
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if documents else 0.0
+        num_documents = len(documents)
+        self.idf = {term: math.log(1 + (num_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for term, postings in self.postings.items()}
+
+    def query_terms(self, query):
+        return list(dict.fromkeys(term for term in tokenize(query) if term not in STOPWORDS))
+
+    def search(self, query, k=4):
+        """Returns up to k (document, score, coverage) tuples, where coverage is the share of query terms found."""
+        terms = self.query_terms(query)
+        scores = {}
+        matched = Counter()
+        for term in terms:
+            for i, frequency in self.postings.get(term, []):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_doc_length)
+                scores[i] = scores.get(i, 0.0) + self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+                matched[i] += 1
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [(self.documents[i], scores[i], matched[i] / len(terms)) for i in ranked]
+
+    def min_match_score(self, query):
+        return LEXICAL_MIN_SCORE * len(self.query_terms(query))
+
+    def is_confident(self, query, results=None):
+        # Short keyword queries ("LED lights", "5 ticks") whose terms all occur in one chunk, and together single
+        # it out, need no semantic search; `results` are those of an earlier search for the query, if any
+        terms = self.query_terms(query)
+        if not terms or len(terms) > LEXICAL_MAX_QUERY_TERMS:
+            return False
+        top = self.search(query, k=1) if results is None else results[:1]
+        return bool(top) and top[0][2] == 1.0 and top[0][1] >= self.min_match_score(query)
+
+
+def _with_score(document, score):
+    return Document(id=document.id, page_content=document.page_content, metadata={**document.metadata, 'score': score})
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 and vector similarity scores, and skips the vector search for confident keyword queries.
+
+    The fused score of every returned chunk is stored in its metadata under 'score'.
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 10
+    score_threshold: float = 0.20
+    vector_weight: float = VECTOR_WEIGHT
+
+    def lexical_only(self, query, lexical_results=None):
+        results = (self.lexical_index.search(query, k=self.k) if lexical_results is None else lexical_results)[:self.k]
+        top_score = results[0][1]
+        # only the chunks that contain every query term
+        return [_with_score(document, score / top_score) for document, score, coverage in results if coverage == 1.0]
+
+    def _fuse(self, query, lexical_results, vector_results):
+        max_lexical = max((score for _, score, _ in lexical_results), default=0.0) or 1.0
+        min_match_score = self.lexical_index.min_match_score(query)
+        candidates = {}
+        for document, score in vector_results:
+            key = (document.metadata.get('source'), document.page_content)
+            candidates[key] = [document, score, 0.0, False]
+        for document, score, _ in lexical_results:
+            key = (document.metadata.get('source'), document.page_content)
+            candidate = candidates.setdefault(key, [document, 0.0, 0.0, False])
+            # ranked on the max-normalised score, but kept only on the absolute one
+            candidate[2:] = [score / max_lexical, score >= min_match_score]
+
+        fused = []
+        for document, vector_score, lexical_score, lexical_match in candidates.values():
+            if vector_score < self.score_threshold and not lexical_match:
+                continue
+            score = self.vector_weight * vector_score + (1 - self.vector_weight) * lexical_score
+            fused.append(_with_score(document, score))
+        fused.sort(key=lambda document: document.metadata['score'], reverse=True)
+        return fused[:self.k]
+
+    def fuse_with_vector_results(self, query, vector_results, lexical_results=None):
+        # For a query whose vector search (fetch_k results with relevance scores) was already done, e.g. in a batch
+        if lexical_results is None:
+            lexical_results = self.lexical_index.search(query, k=self.fetch_k)
+        return self._fuse(query, lexical_results, vector_results)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        lexical_results = self.lexical_index.search(query, k=self.fetch_k)
+        if self.lexical_index.is_confident(query, lexical_results):
+            return self.lexical_only(query, lexical_results)
+        vector_results = self.vectorstore.similarity_search_with_relevance_scores(query, k=self.fetch_k)
+        return self._fuse(query, lexical_results, vector_results)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        lexical_results = self.lexical_index.search(query, k=self.fetch_k)
+        if self.lexical_index.is_confident(query, lexical_results):
+            return self.lexical_only(query, lexical_results)
+        vector_results = await self.vectorstore.asimilarity_search_with_relevance_scores(query, k=self.fetch_k)
+        return self._fuse(query, lexical_results, vector_results)
@@ -0,0 +1,292 @@
+"""Versioned vector indexes.
+
+Every build goes into its own directory, `<INDEX_ROOT>/index-<hash>`, tagged in build_info.json with the
+corpus hashes, chunking parameters and embedding model. The `CURRENT` file names the version that is served.
+Switching it is atomic, and running processes pick the switch up without a restart.
+
+    python -m logics.index_store list
+    python -m logics.index_store activate index-0123456789ab
+    python -m logics.index_store rollback
+    python -m logics.index_store gc --keep 2
+"""
+import helper_functions.sqlite_patch
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from langchain_chroma import Chroma
+from logics.numpy_store import NumpyVectorStore, EMBEDDINGS_FILENAME
+
+
+INDEX_ROOT = os.getenv('INDEX_ROOT', "./vector_db")
+COLLECTION_NAME = "naive_splitter" # one database can have multiple collections
+
+# Text file in INDEX_ROOT holding the name of the index version that the app serves
+POINTER_FILENAME = "CURRENT"
+# The versions the pointer was switched to, one per line, used as a stack: activating a version pushes it and a
+# rollback pops the current one, so repeated rollbacks walk further back instead of toggling between two versions
+HISTORY_FILENAME = "HISTORY"
+BUILD_INFO_FILENAME = "build_info.json"
+VERSION_PREFIX = "index-"
+# What an unfinished build leaves next to the versions: its staging directory and its embedding checkpoint
+STAGING_SUFFIX = ".tmp"
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+# Leftovers of a build untouched for this long (in seconds) are assumed abandoned and deleted by gc
+STALE_BUILD_AGE = 24 * 3600
+
+# "chroma" searches the persisted Chroma collection, "numpy" does exact search over the exported embedding matrix
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma')
+# How often (in seconds) a serving process checks whether the pointer has been switched to another version
+INDEX_CHECK_INTERVAL = float(os.getenv('INDEX_CHECK_INTERVAL', '5'))
+
+logger = logging.getLogger(__name__)
+
+
+def compute_index_version(file_hashes, chunk_size, chunk_overlap, embedding_model):
+    # The version is a hash of everything that affects the vectors: the corpus, the chunking and the embedding model
+    key = json.dumps({
+        'files': file_hashes,
+        'chunk_size': chunk_size,
+        'chunk_overlap': chunk_overlap,
+        'embedding_model': embedding_model,
+    }, sort_keys=True)
+    return VERSION_PREFIX + hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
+
+
+def version_dir(version, index_root=INDEX_ROOT):
+    return os.path.join(index_root, version)
+
+
+def read_current_version(index_root=INDEX_ROOT):
+    pointer_path = os.path.join(index_root, POINTER_FILENAME)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, 'r') as file:
+        return file.read().strip() or None
+
+
+def _replace_file(path, text):
+    # Write to a temporary file and rename it, so readers never see a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_current_version(version, index_root=INDEX_ROOT):
+    _replace_file(os.path.join(index_root, POINTER_FILENAME), version + "\n")
+    with open(os.path.join(index_root, HISTORY_FILENAME), 'a') as file:
+        file.write(version + "\n")
+
+
+def read_build_info(path):
+    with open(os.path.join(path, BUILD_INFO_FILENAME), 'r') as file:
+        return json.load(file)
+
+
+def write_build_info(path, build_info):
+    with open(os.path.join(path, BUILD_INFO_FILENAME), 'w') as file:
+        json.dump(build_info, file, indent=2, sort_keys=True)
+
+
+def open_index(embedding_function, index_root=INDEX_ROOT, backend=VECTOR_BACKEND, version=None):
+    """Opens a prebuilt index, by default the one the pointer refers to. Nothing is embedded or written here.
+
+    Returns the vector store and its version (None for the legacy, unversioned collection).
+    """
+    version = version or read_current_version(index_root)
+    if version is None:
+        # Fall back to the collection written by the old import-time build
+        print("No index version found, run `python -m logics.build_index`. Using the legacy collection.")
+        path = index_root
+    else:
+        path = version_dir(version, index_root)
+        if not os.path.exists(os.path.join(path, BUILD_INFO_FILENAME)):
+            raise FileNotFoundError(f"Index version {version} is incomplete or missing: {path}")
+
+        if backend == 'numpy':
+            if not os.path.exists(os.path.join(path, EMBEDDINGS_FILENAME)):
+                raise FileNotFoundError(f"Index version {version} has no exported embeddings, rebuild it: {path}")
+            return NumpyVectorStore.load(path, embedding_function), version
+
+    vectordb = Chroma(
+        collection_name = COLLECTION_NAME,
+        embedding_function = embedding_function,
+        persist_directory = path)
+    return vectordb, version
+
+
+class LiveIndex:
+    """The index version that the pointer refers to, reopened when the pointer is switched.
+
+    The pointer is read at most once per `check_interval` seconds, so following it costs nothing per request.
+    A version that fails to open is logged and the current one stays in service.
+    """
+
+    def __init__(self, embedding_function, index_root=INDEX_ROOT, backend=VECTOR_BACKEND,
+                 check_interval=INDEX_CHECK_INTERVAL):
+        self.embedding_function = embedding_function
+        self.index_root = index_root
+        self.backend = backend
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (store, version), always replaced as one, so a reader never pairs a store with another version's name
+        self.current = open_index(embedding_function, index_root, backend)
+        self._checked_at = time.monotonic()
+
+    def get(self):
+        """Returns (store, version); callers should use the pair for the whole request."""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._checked_at = time.monotonic()
+                    self._refresh()
+        return self.current
+
+    async def aget(self):
+        """get() for the event loop: opening a new version reads its files, so that is done in a worker thread."""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            return await asyncio.to_thread(self.get)
+        return self.current
+
+    @property
+    def version(self):
+        return self.current[1]
+
+    def _refresh(self):
+        version = read_current_version(self.index_root)
+        if version is None or version == self.version:
+            return
+        try:
+            current = open_index(self.embedding_function, self.index_root, self.backend, version)
+        except Exception:
+            logger.exception("Could not open index %s, still serving %s", version, self.version)
+            return
+        self.current = current
+        logger.info("Switched to index %s", version)
+
+
+def list_versions(index_root=INDEX_ROOT):
+    """Build info of every complete version, oldest first; 'version' is the name of its directory."""
+    versions = []
+    if not os.path.isdir(index_root):
+        return versions
+    for name in os.listdir(index_root):
+        path = version_dir(name, index_root)
+        # A staging directory starts as a copy of the current version, build_info.json included
+        if (name.startswith(VERSION_PREFIX) and not name.endswith(STAGING_SUFFIX) and os.path.isdir(path)
+                and os.path.exists(os.path.join(path, BUILD_INFO_FILENAME))):
+            versions.append({**read_build_info(path), 'version': name})
+    return sorted(versions, key=lambda build_info: build_info['built_at'])
+
+
+def _last_modified(path):
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    return max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(directory, filename))
+                                           for directory, _, filenames in os.walk(path) for filename in filenames])
+
+
+def stale_build_leftovers(index_root=INDEX_ROOT, max_age=STALE_BUILD_AGE):
+    """Staging directories and checkpoints of builds that finished, or have not been touched for `max_age` seconds."""
+    if not os.path.isdir(index_root):
+        return []
+    leftovers = []
+    now = time.time()
+    for name in os.listdir(index_root):
+        for suffix in [STAGING_SUFFIX, CHECKPOINT_SUFFIX]:
+            if name.startswith(VERSION_PREFIX) and name.endswith(suffix):
+                path = version_dir(name, index_root)
+                finished = os.path.exists(os.path.join(version_dir(name[:-len(suffix)], index_root), BUILD_INFO_FILENAME))
+                if finished or now - _last_modified(path) >= max_age:
+                    leftovers.append(name)
+    return sorted(leftovers)
+
+
+def activate_version(version, index_root=INDEX_ROOT):
+    if not os.path.exists(os.path.join(version_dir(version, index_root), BUILD_INFO_FILENAME)):
+        raise FileNotFoundError(f"Index version {version} is incomplete or missing")
+    write_current_version(version, index_root)
+
+
+def rollback_version(index_root=INDEX_ROOT):
+    """Switches back to the version that was served before the current one; returns it.
+
+    The current version is taken off the history, so rolling back again goes to the one before that.
+    """
+    current = read_current_version(index_root)
+    history_path = os.path.join(index_root, HISTORY_FILENAME)
+    history = []
+    if os.path.exists(history_path):
+        with open(history_path, 'r') as file:
+            history = [line.strip() for line in file if line.strip()]
+    while history:
+        version = history[-1]
+        if version != current and os.path.exists(os.path.join(version_dir(version, index_root), BUILD_INFO_FILENAME)):
+            # the history first; after a crash in between, rolling back again finishes the job
+            _replace_file(history_path, ''.join(line + "\n" for line in history))
+            _replace_file(os.path.join(index_root, POINTER_FILENAME), version + "\n")
+            return version
+        # the current version, or one that gc has deleted since
+        history.pop()
+    raise RuntimeError("There is no earlier index version to roll back to")
+
+
+def garbage_collect(index_root=INDEX_ROOT, keep=2, max_build_age=STALE_BUILD_AGE):
+    """Deletes old versions, keeping the current one and the `keep` most recently built others, and the leftovers
+    of abandoned builds; returns the deleted names.
+
+    Keep at least one version, so processes that have not noticed the last switch yet, and rollbacks, still find
+    theirs. A build that is still running keeps its staging directory and checkpoint as long as it writes to them.
+    """
+    current = read_current_version(index_root)
+    others = [build_info['version'] for build_info in list_versions(index_root) if build_info['version'] != current]
+    removed = others[:max(len(others) - keep, 0)] + stale_build_leftovers(index_root, max_build_age)
+    for name in removed:
+        path = version_dir(name, index_root)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the versions of the vector index.")
+    parser.add_argument('--index-root', default=INDEX_ROOT)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list the built versions")
+    activate = commands.add_parser('activate', help="serve the given version")
+    activate.add_argument('version')
+    commands.add_parser('rollback', help="serve the version that was served before the current one")
+    gc = commands.add_parser('gc', help="delete old versions")
+    gc.add_argument('--keep', type=int, default=2, help="number of versions to keep besides the current one")
+    gc.add_argument('--max-build-age', type=float, default=STALE_BUILD_AGE,
+                    help="seconds after which an unfinished build's staging directory and checkpoint are deleted")
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        current = read_current_version(args.index_root)
+        for build_info in list_versions(args.index_root):
+            marker = '*' if build_info['version'] == current else ' '
+            print(f"{marker} {build_info['version']}  built {build_info['built_at']}  {build_info['num_chunks']} chunks  "
+                  f"{build_info['embedding_model']}  chunk size {build_info['chunk_size']}/{build_info['chunk_overlap']}")
+    elif args.command == 'activate':
+        activate_version(args.version, args.index_root)
+        print(f"Serving index {args.version}.")
+    elif args.command == 'rollback':
+        print(f"Serving index {rollback_version(args.index_root)}.")
+    elif args.command == 'gc':
+        removed = garbage_collect(args.index_root, args.keep, args.max_build_age)
+        print(f"Deleted {len(removed)} old versions and build leftovers{': ' + ', '.join(removed) if removed else '.'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+from langchain_community.document_loaders import TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from helper_functions.llm import count_tokens
+
+
+filename_list = [
+    'Energy Efficient Interior Design Tips.txt',
+    'Tips on Buying Energy-Efficient Appliances.txt',
+    'Energy Saving Tips.txt'
+]
+
+# Chunking and embedding settings; any change to these produces a new index version
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 10
+EMBEDDING_MODEL = 'text-embedding-3-small'
+
+
+# Small JSON file kept next to the Chroma files, recording the hash of every source file that was ingested
+MANIFEST_FILENAME = "ingest_manifest.json"
+# Manifest entry holding the settings the collection was built with
+SETTINGS_KEY = "_settings"
+
+
+def index_settings():
+    return {'chunk_size': CHUNK_SIZE, 'chunk_overlap': CHUNK_OVERLAP, 'embedding_model': EMBEDDING_MODEL}
+
+
+def get_text_splitter():
+    # In this case, we intentionally set the chunk_size to 1100 tokens, to have the smallest document (document 2) intact
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=count_tokens)
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# The chunk id is derived from the source and the chunk content, so the same chunk always maps to the same vector
+def chunk_id(document):
+    return hash_text(f"{document.metadata.get('source', '')}\n{document.page_content}")
+
+
+def load_manifest(persist_directory):
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+
+def save_manifest(persist_directory, manifest):
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_and_split(path, text_splitter):
+    # load() returns a list of Document objects
+    documents = TextLoader(path).load()
+    chunks = text_splitter.split_documents(documents)
+    for chunk in chunks:
+        chunk.metadata['chunk_hash'] = hash_text(chunk.page_content)
+    return chunks
+
+
+def sync_vector_store(vectordb, text_splitter, filename_list, persist_directory, data_dir='data', batch_size=None):
+    """Brings the collection in line with the files on disk, embedding only new or changed chunks.
+
+    Returns a dict with the number of chunks added, removed and kept. A collection built with other chunking or
+    embedding settings (or by a build that did not record them) is re-split and re-embedded from scratch.
+    """
+    manifest = load_manifest(persist_directory)
+    settings = index_settings()
+    reuse = manifest.get(SETTINGS_KEY) == settings
+
+    # Group the ids that are already in the collection by their source file
+    existing = vectordb.get(include=["metadatas"])
+    existing_ids = set(existing["ids"])
+    ids_by_source = {}
+    for id, metadata in zip(existing["ids"], existing["metadatas"]):
+        source = (metadata or {}).get('source')
+        ids_by_source.setdefault(source, set()).add(id)
+
+    keep_ids = set()
+    new_documents = {}
+    new_manifest = {SETTINGS_KEY: settings}
+
+    for filename in filename_list:
+        path = os.path.join(data_dir, filename)
+        try:
+            file_hash = hash_file(path)
+        except OSError as e:
+            # a missing file is treated as removed, so its vectors are deleted below
+            print(f"Error loading {filename}: {e}")
+            continue
+
+        # Unchanged file whose chunks are all still present: no loading, no splitting, no embedding
+        if reuse and manifest.get(path) == file_hash and path in ids_by_source:
+            keep_ids.update(ids_by_source[path])
+            new_manifest[path] = file_hash
+            continue
+
+        try:
+            chunks = load_and_split(path, text_splitter)
+        except Exception as e:
+            # if there is an error loading the document, print the error and continue to the next document
+            print(f"Error loading {filename}: {e}")
+            continue
+
+        for chunk in chunks:
+            id = chunk_id(chunk)
+            keep_ids.add(id)
+            if not reuse or id not in existing_ids:
+                new_documents[id] = chunk
+        new_manifest[path] = file_hash
+
+    # Vectors whose chunk no longer exists in any source file (including those written by older, non-hashed builds)
+    # With other settings every vector is stale, even one whose chunk id is unchanged
+    stale_ids = existing_ids - keep_ids if reuse else existing_ids
+    if stale_ids:
+        vectordb.delete(ids=list(stale_ids))
+
+    # Write the new chunks in batches; each batch is embedded by the collection's embedding function
+    ids = list(new_documents.keys())
+    batch_size = batch_size or len(ids) or 1
+    for start in range(0, len(ids), batch_size):
+        batch_ids = ids[start:start + batch_size]
+        vectordb.add_documents(documents=[new_documents[id] for id in batch_ids], ids=batch_ids)
+
+    save_manifest(persist_directory, new_manifest)
+
+    return {
+        'added': len(new_documents),
+        'removed': len(stale_ids),
+        'kept': len(keep_ids) - len(new_documents),
+    }
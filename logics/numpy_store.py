@@ -0,0 +1,119 @@
+import os
+import json
+import math
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+CHUNKS_FILENAME = "chunks.jsonl"
+
+
+def export_numpy_index(vectordb, path):
+    """Writes the chunks and their normalised embeddings from a Chroma collection next to it, for NumpyVectorStore."""
+    stored = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    embeddings = np.asarray(stored["embeddings"], dtype=np.float32)
+    if len(embeddings):
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.save(os.path.join(path, EMBEDDINGS_FILENAME), embeddings)
+    with open(os.path.join(path, CHUNKS_FILENAME), 'w') as file:
+        for id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+            file.write(json.dumps({'id': id, 'text': text, 'metadata': metadata or {}}) + "\n")
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact, in-process vector search over one contiguous float32 matrix.
+
+    Meant for small corpora, where a single matrix product is cheaper than Chroma's SQLite + HNSW stack.
+    Distances and relevance scores follow Chroma's default "l2" collections (squared L2 distance on unit
+    vectors, relevance = 1 - distance / sqrt(2)), so the same score thresholds apply. The store is read-only.
+    """
+
+    def __init__(self, embedding_function, embeddings, ids, texts, metadatas):
+        self._embedding_function = embedding_function
+        self.matrix = embeddings
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+
+    @classmethod
+    def load(cls, path, embedding_function):
+        # memory-mapped, so replicas share the pages of the file and startup does not read it all
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILENAME), mmap_mode='r')
+        ids, texts, metadatas = [], [], []
+        with open(os.path.join(path, CHUNKS_FILENAME), 'r') as file:
+            for line in file:
+                record = json.loads(line)
+                ids.append(record['id'])
+                texts.append(record['text'])
+                metadatas.append(record['metadata'])
+        return cls(embedding_function, embeddings, ids, texts, metadatas)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        embeddings = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        ids = list(ids) if ids is not None else [str(i) for i in range(len(texts))]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        return cls(embedding, embeddings, ids, texts, metadatas)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("NumpyVectorStore is read-only, rebuild the index with `python -m logics.build_index`")
+
+    def get(self, include=None):
+        # Same shape as Chroma's get(), so the lexical index can be built from either store
+        return {'ids': list(self.ids), 'documents': list(self.texts), 'metadatas': list(self.metadatas)}
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance / math.sqrt(2)
+
+    def _search(self, query_embedding, k):
+        if len(self.ids) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        similarities = self.matrix @ query
+        k = min(k, len(self.ids))
+        # top k without sorting the whole array
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(Document(id=self.ids[i], page_content=self.texts[i], metadata=dict(self.metadatas[i])),
+                 float(2.0 - 2.0 * similarities[i])) for i in top]
+
+    def similarity_search_by_vectors_with_relevance_scores(self, embeddings, k=4):
+        """Searches for many query embeddings with one matrix product; returns a list of (document, relevance) lists."""
+        if len(self.ids) == 0:
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        similarities = queries @ self.matrix.T
+        k = min(k, len(self.ids))
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        relevance = self._select_relevance_score_fn()
+        results = []
+        for row, candidates in zip(similarities, top):
+            candidates = candidates[np.argsort(-row[candidates])]
+            results.append([(Document(id=self.ids[i], page_content=self.texts[i], metadata=dict(self.metadatas[i])),
+                             relevance(float(2.0 - 2.0 * row[i]))) for i in candidates])
+        return results
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        return self._search(embedding, k)
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self._search(self._embedding_function.embed_query(query), k)
+
+    async def asimilarity_search_with_score(self, query, k=4, **kwargs):
+        return self._search(await self._embedding_function.aembed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self._search(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
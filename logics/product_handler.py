@@ -0,0 +1,137 @@
+import json
+import streamlit as st
+from helper_functions.llm import (get_completion_by_messages, get_completion_by_messages_stream,
+                                  aget_completion_by_messages, aget_completion_by_messages_stream)
+from helper_functions.tracing import trace, span, set_attributes
+from helper_functions.embedding_cache import normalise_query
+from helper_functions.single_flight import SingleFlight
+from logics.product_matcher import ProductMatcher
+from logics.prompts import (PRODUCT_INSTRUCTIONS, PROMPT_CACHE_MIN_TOKENS, compile_product_system_message,
+                            serialise_products, product_user_message, describe)
+
+
+PRODUCTS_FILEPATH = './data/eligible_products.json'
+
+# Identical questions that are in flight at the same time share one LLM call
+single_flight = SingleFlight()
+
+
+# Load the JSON file once per process; page reruns reuse the parsed dictionary
+@st.cache_resource
+def load_products(filepath=PRODUCTS_FILEPATH):
+    with open(filepath, 'r') as file:
+        json_string = file.read()
+        return json.loads(json_string)
+
+
+@st.cache_resource
+def get_product_matcher():
+    return ProductMatcher(load_products())
+
+
+# Called by helper_functions.preload
+def preload():
+    get_product_matcher()
+    get_product_system_message()
+
+
+# The system message with the whole product table is the same for every query, so it is compiled once
+@st.cache_resource
+def get_product_system_message():
+    return compile_product_system_message(load_products())
+
+
+def compiled_prompts():
+    return [describe(get_product_system_message())]
+
+
+def get_product_messages(user_message, categories=None):
+    system_message = get_product_system_message()
+    # Until the whole table makes a prompt long enough for the provider to cache, only the matched categories are
+    # sent; the instructions ahead of them stay the same either way
+    if categories and system_message.tokens < PROMPT_CACHE_MIN_TOKENS:
+        dict_of_products = load_products()
+        system_content = PRODUCT_INSTRUCTIONS + serialise_products({category: dict_of_products[category]
+                                                                    for category in categories})
+        user_content = product_user_message(user_message)
+    else:
+        system_content = system_message.text
+        user_content = product_user_message(user_message, categories)
+
+    messages =  [
+        {'role':'system',
+         'content': system_content},
+        {'role':'user',
+         'content': user_content},
+    ]
+    return messages
+
+
+def resolve_product_query(user_message):
+    """Returns the answer matched straight from the JSON (or None) and the matched categories."""
+    with span('product_matcher'):
+        answer, categories = get_product_matcher().resolve(user_message)
+    set_attributes(matched_categories=len(categories), matcher_answer=answer is not None)
+    return answer, categories
+
+
+def _identify_product_category(user_message):
+    with trace('eligibility'):
+        # Queries that clearly name one product are answered straight from the JSON, without calling the LLM
+        answer, categories = resolve_product_query(user_message)
+        if answer is not None:
+            return answer
+
+        with span('llm'):
+            response_to_user = get_completion_by_messages(get_product_messages(user_message, categories))
+        return response_to_user
+
+
+def identify_product_category(user_message):
+    return single_flight.do(('answer', normalise_query(user_message)), lambda: _identify_product_category(user_message))
+
+
+# Streaming version of identify_product_category, for use with st.write_stream
+def identify_product_category_stream(user_message):
+    with trace('eligibility', stream=True):
+        answer, categories = resolve_product_query(user_message)
+        if answer is not None:
+            yield answer
+            return
+
+        with span('llm'):
+            yield from get_completion_by_messages_stream(get_product_messages(user_message, categories))
+
+
+# Async counterparts, to be run on the shared event loop of helper_functions.async_runner
+async def _aidentify_product_category(user_message):
+    with trace('eligibility'):
+        answer, categories = resolve_product_query(user_message)
+        if answer is not None:
+            return answer
+
+        with span('llm'):
+            return await aget_completion_by_messages(get_product_messages(user_message, categories))
+
+
+async def _aidentify_product_category_stream(user_message):
+    with trace('eligibility', stream=True):
+        answer, categories = resolve_product_query(user_message)
+        if answer is not None:
+            yield answer
+            return
+
+        with span('llm'):
+            async for chunk in aget_completion_by_messages_stream(get_product_messages(user_message, categories)):
+                yield chunk
+
+
+async def aidentify_product_category(user_message):
+    return await single_flight.ado(('answer', normalise_query(user_message)),
+                                   lambda: _aidentify_product_category(user_message))
+
+
+async def aidentify_product_category_stream(user_message):
+    async for chunk in single_flight.astream(('answer_stream', normalise_query(user_message)),
+                                             lambda: _aidentify_product_category_stream(user_message)):
+        yield chunk
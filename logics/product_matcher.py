@@ -0,0 +1,130 @@
+import re
+import difflib
+
+
+# Other names people use for the product categories in eligible_products.json
+PRODUCT_ALIASES = {
+    'Refrigerator': ['fridge', 'refrigerator', 'refridgerator'],
+    'Air Conditioner': ['aircon', 'air con', 'aircond', 'air conditioner', 'air conditioning', 'air-con'],
+    'Direct Current Fan': ['dc fan', 'direct current fan'],
+    'LED Light': ['led', 'led light'],
+    'Heat Pump Water Heater': ['heat pump water heater', 'hpwh'],
+    'Washing Machine': ['washing machine', 'washer'],
+    'Water Closet': ['water closet', 'toilet', 'toilet bowl', 'wc', 'cistern'],
+    'Sink/Bib tap and mixer': ['sink tap', 'sink mixer', 'bib tap', 'kitchen tap', 'tap', 'mixer'],
+    'Basin tap and mixer': ['basin tap', 'basin mixer', 'basin', 'tap', 'mixer'],
+    'Shower Fittings': ['shower', 'shower head', 'shower fitting'],
+}
+
+# Names that also cover products outside the category, e.g. an AC-motor stand fan or an incandescent bulb. They
+# point the LLM at the category, but never get the pre-rendered "Good news!" answer
+GENERIC_ALIASES = {
+    'Refrigerator': ['freezer'],
+    'Direct Current Fan': ['fan', 'ceiling fan', 'stand fan', 'table fan'],
+    'LED Light': ['light', 'lighting', 'bulb', 'light bulb', 'lamp', 'tube light'],
+    'Heat Pump Water Heater': ['heat pump'],
+}
+
+# Words that do not change what is being asked, e.g. "Is a fridge eligible for the climate vouchers?"
+FILLER_WORDS = {
+    'a', 'about', 'an', 'any', 'are', 'be', 'buy', 'can', 'cfhp', 'check', 'claim', 'climate', 'could', 'covered',
+    'do', 'doe', 'eligibility', 'eligible', 'energy', 'for', 'get', 'hello', 'hi', 'how', 'i', 'info', 'information',
+    'is', 'it', 'label', 'many', 'me', 'my', 'need', 'new', 'number', 'of', 'on', 'please', 'purchase', 'qualify',
+    'requirement', 'tell', 'the', 'tick', 'to', 'under', 'use', 'using', 'voucher', 'what', 'which', 'will', 'with',
+}
+
+MAX_ALIAS_WORDS = 4
+FUZZY_CUTOFF = 0.85
+# Shorter aliases are one letter away from ordinary words ("lead" and "led", "tape" and "tap"), so typos are only
+# corrected towards aliases of at least this many letters
+FUZZY_MIN_ALIAS_LENGTH = 5
+
+CLOSING_SENTENCE = ("Given that retailers may offer different models, it is advisable to enquire with them "
+                    "about the specific models that are eligible for purchase with the Climate Vouchers.")
+
+
+def tokenize(text):
+    tokens = re.findall(r"[a-z0-9]+", text.lower())
+    # crude singular form, so that "fans", "lights" and "taps" match their aliases
+    return [token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+            for token in tokens]
+
+
+class ProductMatcher:
+    """Resolves product queries locally using an alias index over the product categories."""
+
+    def __init__(self, products, aliases=PRODUCT_ALIASES, generic_aliases=GENERIC_ALIASES):
+        self.products = products
+        self.alias_index = {}
+        for category in products:
+            names = [category] + re.split(r"/| and ", category) + aliases.get(category, [])
+            for name in names:
+                key = ' '.join(tokenize(name))
+                if key:
+                    self.alias_index.setdefault(key, set()).add(category)
+        specific_keys = set(self.alias_index)
+        for category, names in generic_aliases.items():
+            if category in products:
+                for name in names:
+                    self.alias_index.setdefault(' '.join(tokenize(name)), set()).add(category)
+        # a name is generic unless some category also uses it as a specific name
+        self.generic_keys = set(self.alias_index) - specific_keys
+        self.fuzzy_aliases = [key for key in self.alias_index if ' ' not in key and len(key) >= FUZZY_MIN_ALIAS_LENGTH]
+
+    def match(self, query):
+        """Returns the matched categories, the query words that were not part of any match, and whether any
+        category was only matched through a generic name."""
+        tokens = tokenize(query)
+        categories = set()
+        leftover = []
+        generic = False
+        i = 0
+        while i < len(tokens):
+            # Longest exact alias starting at this word
+            for n in range(min(MAX_ALIAS_WORDS, len(tokens) - i), 0, -1):
+                key = ' '.join(tokens[i:i + n])
+                if key in self.alias_index:
+                    categories.update(self.alias_index[key])
+                    generic = generic or key in self.generic_keys
+                    i += n
+                    break
+            else:
+                # Fuzzy match single words, to cope with typos like "refigerator"
+                close = []
+                if len(tokens[i]) >= 4 and tokens[i] not in FILLER_WORDS:
+                    close = difflib.get_close_matches(tokens[i], self.fuzzy_aliases, n=1, cutoff=FUZZY_CUTOFF)
+                if close:
+                    categories.update(self.alias_index[close[0]])
+                    generic = generic or close[0] in self.generic_keys
+                else:
+                    leftover.append(tokens[i])
+                i += 1
+        return sorted(categories), leftover, generic
+
+    def resolve(self, query):
+        """Returns (answer, categories).
+
+        The answer is rendered from the JSON when the query clearly names a single product category by its own
+        name or a specific alias, otherwise it is None and the matched categories (possibly empty) are returned
+        for the LLM prompt.
+        """
+        categories, leftover, generic = self.match(query)
+        if len(categories) == 1 and not generic and all(token in FILLER_WORDS for token in leftover):
+            return render_product_answer(categories[0], self.products[categories[0]]), categories
+        return None, categories
+
+
+def render_product_answer(category, requirements):
+    ticks = requirements.get('Number of Ticks', [])
+    remarks = requirements.get('Remarks', '')
+
+    lines = [f"Good news! **{category}** is one of the product categories that can be purchased with the Climate Vouchers.", ""]
+    if ticks:
+        ticks_text = ' or '.join(', '.join(str(tick) for tick in ticks).rsplit(', ', 1))
+        lines.append(f"- **Energy label:** models with {ticks_text} ticks are eligible. The more ticks, the more you save.")
+    else:
+        lines.append("- **Energy label:** this product does not carry any energy label.")
+    if remarks:
+        lines.append(f"- **Remarks:** {remarks}")
+    lines += ["", CLOSING_SENTENCE]
+    return '\n'.join(lines)
@@ -0,0 +1,96 @@
+"""Prompts of the advisor and the eligible product checker.
+
+Every prompt starts with a static prefix that is byte-identical across requests: the instructions, and for the
+product checker the product table serialised canonically. Per-request content (retrieved context, matched
+categories, the question) always comes last. The provider caches a prompt prefix it has seen recently, so a
+stable prefix is billed and processed faster on every request after the first; a prefix shorter than
+PROMPT_CACHE_MIN_TOKENS is not cached at all. While the whole product table is that short, the product checker
+sends only the categories a query matched, which costs fewer input tokens than an uncached full table.
+"""
+import json
+import hashlib
+from collections import namedtuple
+from helper_functions.llm import count_tokens
+
+
+# The shortest prefix the OpenAI API caches
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+QA_INSTRUCTIONS = """Use the pieces of context below to answer the question at the end.
+Determine if the question is relevant to the context or not.
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+Answer the user in a friendly tone.
+You must only rely on the facts or information in the database. Your response should be as detail as possible and
+include information that is useful for the user to make informed decisions on energy saving and efficiency.
+Make sure the statements are factually accurate.
+Use Neural Linguistic Programming to construct your response."""
+
+# Prompt for the RAG pipeline; the retrieved context changes with every question, so it follows the instructions
+QA_TEMPLATE = QA_INSTRUCTIONS + """
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+PRODUCT_DELIMITER = "####"
+
+PRODUCT_INSTRUCTIONS = f"""You will be provided with customer service queries.
+Follow these instructions to answer the customer queries.
+The customer query will be delimited with a pair {PRODUCT_DELIMITER}.
+
+Decide if the query is relevant to any specific products in the JSON object at the end of these instructions, \
+which each key is a `product category` and the value is the `requirements` of the eligible products.
+Some of the product categories have a list of ticks that the product must have on the energy label to be eligible for the Climate Vouchers.
+The more ticks, the more you save.
+Additional `remarks` are also provided for some of the product categories, especially those without energy labels.
+The query may be followed by the product categories that it seems to be about; use them as a hint only.
+
+You must only rely on the information in the products information in the JSON object.
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+Your response should be as detail as possible and include information that is useful for customer to better understand the eligible product.
+
+Answer the customer in a friendly tone.
+Make sure the statements are factually accurate.
+If there are any relevant product found, output the `product category` and the associated `requirements` into in a tidy and readable format.
+For those product categories that have an empty list for number of ticks, inform the user that the product do not carry any energy label.
+Use Neural Linguistic Programming to construct your response.
+Always include at the end of the response that 'Given that retailers may offer different models, it is advisable to enquire with them about the specific models that are eligible for purchase with the Climate Vouchers.'.
+If there are no relevant product found, ask the user to be more specific and provide more details about the product.
+
+Ensure that your response is readable and without any enclosing tags or delimiters.
+
+Eligible products:
+"""
+
+CompiledPrompt = namedtuple('CompiledPrompt', ['name', 'text', 'tokens', 'sha256'])
+
+
+def compile_prompt(name, text):
+    return CompiledPrompt(name, text, count_tokens(text), hashlib.sha256(text.encode('utf-8')).hexdigest())
+
+
+def describe(compiled):
+    """A row for inspecting a compiled prompt prefix, e.g. on the Performance page."""
+    return {'prompt': compiled.name, 'prefix_tokens': compiled.tokens, 'sha256': compiled.sha256[:12],
+            'cacheable': compiled.tokens >= PROMPT_CACHE_MIN_TOKENS}
+
+
+def serialise_products(products):
+    # Sorted keys and fixed separators, so the same products always give the same bytes
+    return json.dumps(products, sort_keys=True, ensure_ascii=False, separators=(', ', ': '))
+
+
+def compile_product_system_message(products):
+    return compile_prompt('eligibility', PRODUCT_INSTRUCTIONS + serialise_products(products))
+
+
+def compile_qa_prefix():
+    return compile_prompt('advisor', QA_TEMPLATE.split('{context}')[0])
+
+
+def product_user_message(user_message, categories=None):
+    content = f"{PRODUCT_DELIMITER}{user_message}{PRODUCT_DELIMITER}"
+    if categories:
+        content += f"\nProduct categories: {', '.join(categories)}"
+    return content
@@ -1,171 +1,251 @@
 # VERY FIRST LINES of main.py (or the file Streamlit runs)
-import sys
-try:
-    # prefer the dbapi2 alias
-    from pysqlite3 import dbapi2 as sqlite3_replacement
-    sys.modules['sqlite3'] = sqlite3_replacement
-except Exception:
-    # fallback if named differently
-    try:
-        import pysqlite3 as p
-        sys.modules['sqlite3'] = p
-    except Exception:
-        # allow normal flow; you'll see the Chroma error if replacement failed
-        pass
+import helper_functions.sqlite_patch
 
 import streamlit as st
-import pandas as pd
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
-import tiktoken
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import asyncio
 from langchain_openai import OpenAIEmbeddings
 from langchain_openai import ChatOpenAI
-from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from helper_functions.llm import langchain_openai_kwargs, get_request_limiter
+from helper_functions.embedding_cache import CachedEmbeddings, normalise_query
+from helper_functions.single_flight import SingleFlight
+from helper_functions.tracing import trace, span, set_attributes, mark_first_token, record_langchain_usage
+from logics.ingestion import EMBEDDING_MODEL
+from logics.index_store import LiveIndex
+from logics.answer_cache import AnswerCache
+from logics.hybrid_retriever import BM25Index, HybridRetriever, load_chunks
+from logics.context_builder import BudgetedRetriever, CONTEXT_TOKEN_BUDGET
+from logics.prompts import QA_TEMPLATE, compile_qa_prefix, describe
 
 
-if load_dotenv('.env'):
-   # for local development
-   OPENAI_KEY = os.getenv('OPENAI_API_KEY')
-else:
-   OPENAI_KEY = st.secrets['OPENAI_API_KEY']
+# embedding model that we will use for the session. Query embeddings are cached and shared by all sessions, so the
+# answer cache lookup and the vector search of the same question cost one embedding call at most
+embeddings_model = CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL, **langchain_openai_kwargs()),
+                                    model_name=EMBEDDING_MODEL)
 
-# Pass the API Key to the OpenAI Client
-client = OpenAI(api_key=OPENAI_KEY)
+# llm to be used in RAG pipeplines in this notebook; stream_usage reports the token usage of streamed answers too
+llm = ChatOpenAI(model='gpt-4o-mini', temperature=0, seed=42, stream_usage=True, **langchain_openai_kwargs())
 
-def get_embedding(input, model='text-embedding-3-small'):
-    response = client.embeddings.create(
-        input=input,
-        model=model
-    )
-    return [x.embedding for x in response.data]
+# The prebuilt index that vector_db/CURRENT points to, opened read-only. It is built offline with
+# `python -m logics.build_index`; when another version is activated, running processes switch to it by themselves.
+live_index = LiveIndex(embeddings_model)
 
 
-# This is the "Updated" helper function for calling LLM
-def get_completion(prompt, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1, json_output=False):
-    if json_output == True:
-      output_json_structure = {"type": "json_object"}
+# Identical questions that are in flight at the same time share one run of the pipeline
+single_flight = SingleFlight()
+
+
+# There is no universal threshold, it depends on the use case
+SCORE_THRESHOLD = float(os.getenv('RETRIEVAL_SCORE_THRESHOLD', '0.20'))
+# "hybrid" fuses BM25 and vector scores, "vector" is dense similarity search only
+RETRIEVER_MODE = os.getenv('RETRIEVER_MODE', 'hybrid')
+
+
+# The prompt and retriever are built once per process and shared by every session; they hold no per-request state
+@st.cache_resource
+def get_qa_prompt(template=QA_TEMPLATE):
+    return PromptTemplate.from_template(template)
+
+
+# The instructions ahead of the retrieved context, identical in every advisor prompt
+@st.cache_resource
+def get_qa_prefix():
+    return compile_qa_prefix()
+
+
+def compiled_prompts():
+    return [describe(get_qa_prefix())]
+
+
+# In-memory BM25 index over the same chunks as the Chroma collection. The lexical index and the retriever are built
+# per index version (the store itself is not hashed, hence the underscore); the previous version's are kept
+# for requests that are still using it.
+@st.cache_resource(max_entries=2)
+def get_lexical_index(_vectordb, index_version):
+    return BM25Index(load_chunks(_vectordb))
+
+
+# The retrieved chunks are deduplicated and packed into the context token budget before they reach the prompt
+@st.cache_resource(max_entries=2)
+def get_retriever(_vectordb, index_version, score_threshold=SCORE_THRESHOLD, mode=RETRIEVER_MODE,
+                  context_budget=CONTEXT_TOKEN_BUDGET):
+    if mode == 'hybrid':
+        retriever = HybridRetriever(vectorstore=_vectordb, lexical_index=get_lexical_index(_vectordb, index_version),
+                                    score_threshold=score_threshold)
     else:
-      output_json_structure = None
-
-    messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create( #originally was openai.chat.completions
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        top_p=top_p,
-        max_tokens=max_tokens,
-        n=1,
-        response_format=output_json_structure,
-    )
-    return response.choices[0].message.content
-
-
-# Note that this function directly take in "messages" as the parameter.
-def get_completion_by_messages(messages, model="gpt-4o-mini", temperature=0, top_p=1.0, max_tokens=1024, n=1):
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        top_p=top_p,
-        max_tokens=max_tokens,
-        n=1
-    )
-    return response.choices[0].message.content
-
-
-# This function is for calculating the tokens given the "message"
-# ⚠️ This is simplified implementation that is good enough for a rough estimation
-def count_tokens(text):
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
-    return len(encoding.encode(text))
-
-
-def count_tokens_from_message(messages):
-    encoding = tiktoken.encoding_for_model('gpt-4o-mini')
-    value = ' '.join([x.get('content') for x in messages])
-    return len(encoding.encode(value))
-
-filename_list = [
-    'Energy Efficient Interior Design Tips.txt',
-    'Tips on Buying Energy-Efficient Appliances.txt',
-    'Energy Saving Tips.txt'    
-]
-
-# load the documents
-list_of_documents_loaded = []
-
-for filename in filename_list:
-    try:
-        # try to load the document
-        markdown_path = os.path.join('data', filename)
-        loader = TextLoader(markdown_path)
-
-        # load() returns a list of Document objects
-        data = loader.load()
-
-        # use extend() to add to the list_of_documents_loaded
-        list_of_documents_loaded.extend(data)
-
-    except Exception as e:
-        # if there is an error loading the document, print the error and continue to the next document
-        print(f"Error loading {filename}: {e}")
-        continue
-
-# In this case, we intentionally set the chunk_size to 1100 tokens, to have the smallest document (document 2) intact
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=10, length_function=count_tokens)
-
-# Split the documents into smaller chunks
-splitted_documents = text_splitter.split_documents(list_of_documents_loaded)
-
-# embedding model that we will use for the session
-embeddings_model = OpenAIEmbeddings(model='text-embedding-3-small')
-
-# llm to be used in RAG pipeplines in this notebook
-llm = ChatOpenAI(model='gpt-4o-mini', temperature=0, seed=42)
-
-# Create the vector database
-vectordb = Chroma.from_documents(
-    documents = splitted_documents,
-    embedding = embeddings_model,
-    collection_name = "naive_splitter", # one database can have multiple collections
-    persist_directory = "./vector_db")
+        retriever = _vectordb.as_retriever(search_type="similarity_score_threshold",
+                                          search_kwargs={'score_threshold': score_threshold})
+    return BudgetedRetriever(retriever=retriever, budget=context_budget)
+
+
+# Answers are shared across sessions and processes through the SQLite file next to the index; each process
+# picks up the answers the others store on its next lookup
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache()
+
+
+# Called by helper_functions.preload, so the first question does not pay for building these
+def preload():
+    get_qa_prefix()
+    get_retriever(*live_index.get())
+    get_answer_cache()
+
+
+# Keyword queries that the hybrid retriever answers from the lexical index alone. Their answers are cached by
+# the question text, so they are served without any embedding call.
+def is_lexical_query(user_message, vectordb, index_version):
+    return RETRIEVER_MODE == 'hybrid' and get_lexical_index(vectordb, index_version).is_confident(user_message)
+
+
+def lookup_answer(user_message, vectordb, index_version):
+    """Returns the cached answer (or None) and the query embedding (None for lexical queries)."""
+    if is_lexical_query(user_message, vectordb, index_version):
+        with span('answer_cache'):
+            cached_answer = get_answer_cache().lookup_exact(user_message, index_version)
+        set_attributes(cache_hit=cached_answer is not None, lexical=True)
+        return cached_answer, None
+    # Reuse the answer to a previous question that is close enough, without calling the LLM
+    with span('embedding'):
+        query_embedding = embeddings_model.embed_query(user_message)
+    with span('answer_cache'):
+        cached_answer = get_answer_cache().lookup(query_embedding, index_version)
+    set_attributes(cache_hit=cached_answer is not None, lexical=False)
+    return cached_answer, query_embedding
+
+
+# The "stuff" RAG pipeline, as separate steps so each one is timed: retrieve, fill the prompt, call the LLM
+def build_prompt(user_message, documents):
+    with span('prompt'):
+        context = "\n\n".join(document.page_content for document in documents)
+        prompt = get_qa_prompt().format(context=context, question=user_message)
+    set_attributes(context_chunks=len(documents))
+    return prompt
+
+
+def retrieve_and_build_prompt(user_message, retriever):
+    with span('retrieval'):
+        documents = retriever.invoke(user_message)
+    return build_prompt(user_message, documents)
+
+
+async def aretrieve_and_build_prompt(user_message, retriever):
+    with span('retrieval'):
+        documents = await retriever.ainvoke(user_message)
+    return build_prompt(user_message, documents)
+
+
+def _process_user_message(user_message):
+    with trace('advisor'):
+        # One index version for the whole request, even if the pointer is switched meanwhile
+        vectordb, index_version = live_index.get()
+        set_attributes(index_version=index_version)
+        cached_answer, query_embedding = lookup_answer(user_message, vectordb, index_version)
+        if cached_answer is not None:
+            return cached_answer
+
+        prompt = retrieve_and_build_prompt(user_message, get_retriever(vectordb, index_version))
+        with span('llm'):
+            response = llm.invoke(prompt)
+        record_langchain_usage(response)
+        get_answer_cache().store(user_message, query_embedding, response.content, index_version)
+        return response.content
 
 
 def process_user_message(user_message):
-    # Build prompt
-    template = """Use the following pieces of context to answer the question at the end.
-    Determine if the question is relevant to the context or not.
-    If you don't know the answer, just say that you don't know, don't try to make up an answer.
-    Answer the user in a friendly tone.
-    You must only rely on the facts or information in the database. Your response should be as detail as possible and
-    include information that is useful for the user to make informed decisions on energy saving and efficiency.
-    Make sure the statements are factually accurate.
-    Use Neural Linguistic Programming to construct your response.
-
-    {context}
-    Question: {question}
-    Helpful Answer:"""
-
-    QA_CHAIN_PROMPT = PromptTemplate.from_template(template)
-
-# Run chain
-    qa_chain = RetrievalQA.from_chain_type(
-        llm = llm,
-        retriever=vectordb.as_retriever(search_type="similarity_score_threshold",
-                                        # There is no universal threshold, it depends on the use case
-                                        search_kwargs={'score_threshold': 0.20}),
-        # return_source_documents=True, # Make inspection of document possible
-        chain_type_kwargs={"prompt": QA_CHAIN_PROMPT}
-    )
-
-    llm_response = qa_chain.invoke(user_message)
-    return llm_response['result']
-
-
-response = process_user_message("What are some general tips for purchasing of electrical appliances?")
-print(response)
\ No newline at end of file
+    return single_flight.do(('answer', normalise_query(user_message)), lambda: _process_user_message(user_message))
+
+
+# Streaming version of process_user_message, for use with st.write_stream
+def process_user_message_stream(user_message):
+    with trace('advisor', stream=True):
+        # One index version for the whole request, even if the pointer is switched meanwhile
+        vectordb, index_version = live_index.get()
+        set_attributes(index_version=index_version)
+        cached_answer, query_embedding = lookup_answer(user_message, vectordb, index_version)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        prompt = retrieve_and_build_prompt(user_message, get_retriever(vectordb, index_version))
+        answer = []
+        with span('llm'):
+            for chunk in llm.stream(prompt):
+                # the last chunk carries the token usage
+                record_langchain_usage(chunk)
+                if chunk.content:
+                    mark_first_token()
+                    answer.append(chunk.content)
+                    yield chunk.content
+        get_answer_cache().store(user_message, query_embedding, ''.join(answer), index_version)
+
+
+# Async counterparts of the functions above. Run them on the shared event loop of helper_functions.async_runner,
+# so requests from all sessions overlap and share one concurrency limit. The answer cache's SQLite reads and
+# writes run in worker threads, so they never hold up the other requests on the loop.
+async def alookup_answer(user_message, vectordb, index_version):
+    if is_lexical_query(user_message, vectordb, index_version):
+        with span('answer_cache'):
+            cached_answer = await asyncio.to_thread(get_answer_cache().lookup_exact, user_message, index_version)
+        set_attributes(cache_hit=cached_answer is not None, lexical=True)
+        return cached_answer, None
+    with span('embedding'):
+        async with get_request_limiter():
+            query_embedding = await embeddings_model.aembed_query(user_message)
+    with span('answer_cache'):
+        cached_answer = await asyncio.to_thread(get_answer_cache().lookup, query_embedding, index_version)
+    set_attributes(cache_hit=cached_answer is not None, lexical=False)
+    return cached_answer, query_embedding
+
+
+async def _aprocess_user_message(user_message):
+    with trace('advisor'):
+        vectordb, index_version = await live_index.aget()
+        set_attributes(index_version=index_version)
+        cached_answer, query_embedding = await alookup_answer(user_message, vectordb, index_version)
+        if cached_answer is not None:
+            return cached_answer
+
+        prompt = await aretrieve_and_build_prompt(user_message, get_retriever(vectordb, index_version))
+        with span('llm'):
+            async with get_request_limiter():
+                response = await llm.ainvoke(prompt)
+        record_langchain_usage(response)
+        await asyncio.to_thread(get_answer_cache().store, user_message, query_embedding, response.content,
+                                index_version)
+        return response.content
+
+
+async def _aprocess_user_message_stream(user_message):
+    with trace('advisor', stream=True):
+        vectordb, index_version = await live_index.aget()
+        set_attributes(index_version=index_version)
+        cached_answer, query_embedding = await alookup_answer(user_message, vectordb, index_version)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        prompt = await aretrieve_and_build_prompt(user_message, get_retriever(vectordb, index_version))
+        answer = []
+        with span('llm'):
+            async with get_request_limiter():
+                async for chunk in llm.astream(prompt):
+                    record_langchain_usage(chunk)
+                    if chunk.content:
+                        mark_first_token()
+                        answer.append(chunk.content)
+                        yield chunk.content
+        await asyncio.to_thread(get_answer_cache().store, user_message, query_embedding, ''.join(answer),
+                                index_version)
+
+
+async def aprocess_user_message(user_message):
+    return await single_flight.ado(('answer', normalise_query(user_message)), lambda: _aprocess_user_message(user_message))
+
+
+# Callers asking the same question while it is being answered all receive the one stream, from its first chunk
+async def aprocess_user_message_stream(user_message):
+    async for chunk in single_flight.astream(('answer_stream', normalise_query(user_message)),
+                                             lambda: _aprocess_user_message_stream(user_message)):
+        yield chunk
@@ -1,10 +1,10 @@
 
 
 # Set up and run this Streamlit App
+# Only light modules are imported up front, so the login page renders without loading the advisor
 import streamlit as st
-import pandas as pd
-from logics.query_handler import process_user_message
 from helper_functions.utility import check_password  
+from helper_functions.preload import preload_in_background
 
 
 # region <--------- Streamlit App Configuration --------->
@@ -20,6 +20,9 @@ st.title("Energy Saver Advisor")
 if not check_password():  
     st.stop()
 
+# Load the models and the vector index while the user types the first question
+preload_in_background('logics.query_handler')
+
 st.expander("""
 
 IMPORTANT NOTICE: This web application is a prototype developed for educational purposes only. The information provided here is NOT intended for real-world usage and should not be relied upon for making any decisions, especially those related to financial, legal, or healthcare matters.
@@ -30,6 +33,10 @@ Always consult with qualified professionals for accurate and personalized advice
 
 """)
 
+# The advisor remembers the conversation of this session, so follow-up questions need not repeat it
+if 'advisor_memory' in st.session_state and st.button("Start a new conversation"):
+    del st.session_state['advisor_memory']
+
 form = st.form(key="form")
 form.subheader("WattSaver: Your Friendly Energy Advisor")
 
@@ -41,7 +48,15 @@ if form.form_submit_button("Submit"):
 
     st.divider()
 
-    response = process_user_message(user_prompt)
-    st.write(response)
+    # Waits for the preload if it is still running
+    from logics.query_handler import aprocess_user_message_stream
+    from helper_functions.async_runner import iterate_async
+    from helper_functions.conversation import ConversationMemory, aconverse_stream
+
+    memory = st.session_state.setdefault('advisor_memory', ConversationMemory())
+    # Show the answer as it is generated; the request itself runs on the shared event loop
+    st.write_stream(iterate_async(aconverse_stream(memory, user_prompt, aprocess_user_message_stream)))
+    if memory.last_rewrite:
+        st.caption(f"Answered as: {memory.last_rewrite}")
 
 
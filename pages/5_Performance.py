@@ -0,0 +1,64 @@
+import sys
+import streamlit as st
+from helper_functions.tracing import TRACE_LOG_PATH, load_records, summarize, get_histograms
+
+# region <--------- Streamlit App Configuration --------->
+st.set_page_config(
+    layout="centered",
+    page_title="Energy Saver Advisor"
+)
+# endregion <--------- Streamlit App Configuration --------->
+
+st.title("Performance")
+st.caption(f"Latency of recent requests, read from the trace log at `{TRACE_LOG_PATH}`.")
+
+records = load_records()
+if not records:
+    st.info("No requests have been traced yet.")
+    st.stop()
+
+st.header("Latency percentiles")
+st.dataframe(summarize(records), hide_index=True, use_container_width=True)
+
+st.header("Token usage")
+usage = {}
+for record in records:
+    totals = usage.setdefault(record['name'], {'request': record['name'], 'requests': 0, 'llm_calls': 0,
+                                               'input_tokens': 0, 'cached_tokens': 0, 'output_tokens': 0})
+    totals['requests'] += 1
+    if 'llm' in record['spans']:
+        totals['llm_calls'] += 1
+    for key in ['input_tokens', 'cached_tokens', 'output_tokens']:
+        totals[key] += record['attributes'].get(key, 0)
+st.dataframe(list(usage.values()), hide_index=True, use_container_width=True)
+
+# Only shown once this process has served a question; importing the query handler here would load the index
+query_handler = sys.modules.get('logics.query_handler')
+if query_handler is not None:
+    st.header("Caches")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Answer cache")
+        st.json(query_handler.get_answer_cache().stats())
+    with col2:
+        st.subheader("Query embeddings")
+        st.json(query_handler.embeddings_model.stats())
+
+# Identical questions that were answered by a single upstream call
+handlers = {'Advisor': query_handler, 'Eligibility checker': sys.modules.get('logics.product_handler')}
+coalescing = [{'page': page, **module.single_flight.stats()} for page, module in handlers.items() if module is not None]
+if coalescing:
+    st.header("Coalesced requests")
+    st.dataframe(coalescing, hide_index=True, use_container_width=True)
+
+# The static prompt prefixes; cached_tokens in the token usage above shows how often the provider reused them
+prompts = [row for module in handlers.values() if module is not None for row in module.compiled_prompts()]
+if prompts:
+    st.header("Prompt prefixes")
+    st.dataframe(prompts, hide_index=True, use_container_width=True)
+
+with st.expander("Latency histograms of this process"):
+    for stage, buckets in sorted(get_histograms().items()):
+        st.write(f"**{stage}**")
+        st.bar_chart([{'bucket': f"≤ {bound:g} ms" if bound != float('inf') else "slower", 'requests': count}
+                      for bound, count in buckets if count], x='bucket', y='requests', horizontal=True)
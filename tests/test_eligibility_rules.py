@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+from logics.eligibility_rules import INPUT_COLUMNS, ELIGIBILITY_TABLE, check_eligibility, check_eligibility_bulk
+
+
+BOTH = "You are eligible for both the 300 SGD and 100 SGD Climate Vouchers."
+ONLY_300 = "You are eligible for the 300 SGD Climate Vouchers."
+ONLY_100 = "You are eligible for the 100 SGD Climate Vouchers."
+ALL_CLAIMED = "You have claimed all of the Climate Vouchers!"
+NOT_ELIGIBLE = "You are not eligible for the Climate Vouchers."
+
+# Every combination of inputs, with the message the page's original if/elif logic wrote for it
+EXPECTED = {
+    ("Singapore Citizen", "HDB", "No", "No"): (True, True, BOTH),
+    ("Singapore Citizen", "HDB", "No", "Yes"): (True, False, ONLY_300),
+    ("Singapore Citizen", "HDB", "Yes", "No"): (False, True, ONLY_100),
+    ("Singapore Citizen", "HDB", "Yes", "Yes"): (False, False, ALL_CLAIMED),
+    ("Singapore Citizen", "Private Residential Property", "No", "No"): (True, True, BOTH),
+    ("Singapore Citizen", "Private Residential Property", "No", "Yes"): (True, False, ONLY_300),
+    ("Singapore Citizen", "Private Residential Property", "Yes", "No"): (False, True, ONLY_100),
+    ("Singapore Citizen", "Private Residential Property", "Yes", "Yes"): (False, False, ALL_CLAIMED),
+    ("Permanent Resident", "HDB", "No", "No"): (True, True, BOTH),
+    ("Permanent Resident", "HDB", "No", "Yes"): (True, False, ONLY_300),
+    ("Permanent Resident", "HDB", "Yes", "No"): (False, True, ONLY_100),
+    ("Permanent Resident", "HDB", "Yes", "Yes"): (False, False, ALL_CLAIMED),
+    ("Permanent Resident", "Private Residential Property", "No", "No"): (False, False, NOT_ELIGIBLE),
+    ("Permanent Resident", "Private Residential Property", "No", "Yes"): (False, False, NOT_ELIGIBLE),
+    ("Permanent Resident", "Private Residential Property", "Yes", "No"): (False, False, NOT_ELIGIBLE),
+    ("Permanent Resident", "Private Residential Property", "Yes", "Yes"): (False, False, NOT_ELIGIBLE),
+    ("Others", "HDB", "No", "No"): (False, False, NOT_ELIGIBLE),
+    ("Others", "HDB", "No", "Yes"): (False, False, NOT_ELIGIBLE),
+    ("Others", "HDB", "Yes", "No"): (False, False, NOT_ELIGIBLE),
+    ("Others", "HDB", "Yes", "Yes"): (False, False, NOT_ELIGIBLE),
+    ("Others", "Private Residential Property", "No", "No"): (False, False, NOT_ELIGIBLE),
+    ("Others", "Private Residential Property", "No", "Yes"): (False, False, NOT_ELIGIBLE),
+    ("Others", "Private Residential Property", "Yes", "No"): (False, False, NOT_ELIGIBLE),
+    ("Others", "Private Residential Property", "Yes", "Yes"): (False, False, NOT_ELIGIBLE),
+}
+
+
+def test_table_covers_every_combination():
+    assert len(EXPECTED) == 24
+    assert set(ELIGIBILITY_TABLE) == set(EXPECTED)
+
+
+@pytest.mark.parametrize("inputs, expected", sorted(EXPECTED.items()))
+def test_check_eligibility(inputs, expected):
+    assert tuple(check_eligibility(*inputs)) == expected
+
+
+@pytest.mark.parametrize("inputs", [
+    ("Tourist", "HDB", "No", "No"),
+    ("Singapore Citizen", "Condo", "No", "No"),
+    ("Singapore Citizen", "HDB", "no", "No"),
+])
+def test_check_eligibility_rejects_unknown_inputs(inputs):
+    with pytest.raises(ValueError):
+        check_eligibility(*inputs)
+
+
+def test_bulk_matches_expected_in_any_row_order():
+    combinations = sorted(EXPECTED)[::-1]
+    screened = check_eligibility_bulk(pd.DataFrame(combinations, columns=INPUT_COLUMNS))
+    assert list(screened[INPUT_COLUMNS].itertuples(index=False, name=None)) == combinations
+    assert screened['valid'].all()
+    for row in screened.itertuples(index=False):
+        inputs = (row.residential_status, row.property_type, row.claimed_300, row.claimed_100)
+        assert (row.eligible_300, row.eligible_100, row.message) == EXPECTED[inputs]
+
+
+def test_bulk_strips_whitespace():
+    households = pd.DataFrame([(" Singapore Citizen", "HDB ", " No", "Yes ")], columns=INPUT_COLUMNS)
+    row = check_eligibility_bulk(households).iloc[0]
+    assert row['valid'] and (row['eligible_300'], row['eligible_100'], row['message']) == (True, False, ONLY_300)
+
+
+def test_bulk_flags_unknown_values():
+    households = pd.DataFrame([
+        ("Singapore Citizen", "HDB", "No", "No"),
+        ("Tourist", "HDB", "No", "No"),
+        ("Permanent Resident", "HDB", "maybe", "No"),
+        ("Permanent Resident", "HDB", "Yes", "No"),
+    ], columns=INPUT_COLUMNS)
+    screened = check_eligibility_bulk(households)
+    assert screened['valid'].tolist() == [True, False, False, True]
+    assert screened['eligible_300'].tolist() == [True, False, False, False]
+    assert screened['eligible_100'].tolist() == [True, False, False, True]
+    assert screened['message'].isna().tolist() == [False, True, True, False]
+    assert screened['message'].iloc[3] == ONLY_100
@@ -0,0 +1,72 @@
+import numpy as np
+from helper_functions.embedding_cache import DiskVectorStore, CachedEmbeddings
+
+
+def vector(value, dim=8):
+    return np.full(dim, value, dtype=np.float32)
+
+
+def test_two_stores_appending_to_one_directory(tmp_path):
+    first = DiskVectorStore(str(tmp_path))
+    second = DiskVectorStore(str(tmp_path))
+    for i in range(50):
+        first.put(f"first-{i}", vector(i))
+        second.put(f"second-{i}", vector(1000 + i))
+
+    # each store reads its own rows back, wherever the other one's rows ended up in between
+    assert first.get("first-49")[0] == 49
+    assert second.get("second-49")[0] == 1049
+
+    reopened = DiskVectorStore(str(tmp_path))
+    assert len(reopened.rows) == 100
+    for i in range(50):
+        assert reopened.get(f"first-{i}")[0] == i
+        assert reopened.get(f"second-{i}")[0] == 1000 + i
+
+
+def test_store_starts_over_when_full(tmp_path):
+    first = DiskVectorStore(str(tmp_path), max_entries=10)
+    second = DiskVectorStore(str(tmp_path), max_entries=10)
+    for i in range(10):
+        first.put(f"first-{i}", vector(i))
+    # the other store notices the files were replaced before it appends
+    second.put("second-0", vector(1000))
+    first.put("first-10", vector(10))
+
+    reopened = DiskVectorStore(str(tmp_path), max_entries=10)
+    assert set(reopened.rows) == {"second-0", "first-10"}
+    assert reopened.get("second-0")[0] == 1000
+    assert reopened.get("first-10")[0] == 10
+    assert second.get("second-0")[0] == 1000
+
+
+def test_torn_last_row_is_ignored(tmp_path):
+    store = DiskVectorStore(str(tmp_path))
+    store.put("a", vector(1))
+    with open(store.vectors_path, 'ab') as file:
+        file.write(b"\0" * 5)
+    store = DiskVectorStore(str(tmp_path))
+    store.put("b", vector(2))
+    assert DiskVectorStore(str(tmp_path)).get("b")[0] == 2
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text))] * 8
+
+
+def test_cached_embeddings_normalise_the_query_and_return_lists(tmp_path):
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, 'model', max_entries=1, cache_dir=str(tmp_path))
+    first = cached.embed_query("How do I pick an aircon?")
+    assert cached.embed_query("how do i   pick an AIRCON?") == first
+    assert isinstance(first, list)
+    cached.embed_query("another question")
+    # evicted from memory, still on disk
+    assert cached.embed_query("How do I pick an aircon?") == first
+    assert embeddings.calls == 2
+    assert cached.stats()['disk_hits'] == 1
@@ -0,0 +1,130 @@
+import asyncio
+from helper_functions.single_flight import SingleFlight
+
+
+class Upstream:
+    """An async generator factory that counts its calls and remembers whether it was cancelled."""
+
+    def __init__(self, chunks=5, fail_after=None, delay=0.01):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            for i in range(self.chunks):
+                if i == self.fail_after:
+                    raise ValueError("upstream failed")
+                await asyncio.sleep(self.delay)
+                yield str(i)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+async def collect(stream):
+    return ''.join([chunk async for chunk in stream])
+
+
+def test_ado_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*[single_flight.ado('key', answer) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert single_flight.stats()['coalesced'] == 4
+
+
+def test_ado_propagates_the_error_to_every_caller_and_frees_the_key():
+    single_flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        results = await asyncio.gather(*[single_flight.ado('key', fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+        async def succeed():
+            return "answer"
+        # the failed call is not cached: the next caller starts a new one
+        return await single_flight.ado('key', succeed)
+
+    assert asyncio.run(main()) == "answer"
+
+
+def test_astream_joiner_gets_the_chunks_sent_before_it_joined():
+    single_flight = SingleFlight()
+    upstream = Upstream()
+
+    async def main():
+        first = asyncio.create_task(collect(single_flight.astream('key', upstream)))
+        await asyncio.sleep(0.025)
+        second = await collect(single_flight.astream('key', upstream))
+        return await first, second
+
+    assert asyncio.run(main()) == ("01234", "01234")
+    assert upstream.calls == 1
+
+
+def test_astream_early_leaver_does_not_stop_the_others():
+    single_flight = SingleFlight()
+    upstream = Upstream()
+
+    async def main():
+        leaver = single_flight.astream('key', upstream)
+        stayer = asyncio.create_task(collect(single_flight.astream('key', upstream)))
+        assert await leaver.__anext__() == "0"
+        await leaver.aclose()
+        return await stayer
+
+    assert asyncio.run(main()) == "01234"
+    assert upstream.calls == 1
+    assert upstream.cancelled == 0
+
+
+def test_astream_late_joiner_after_everyone_left_starts_a_new_call():
+    single_flight = SingleFlight()
+    upstream = Upstream()
+
+    async def main():
+        stream = single_flight.astream('key', upstream)
+        assert await stream.__anext__() == "0"
+        await stream.aclose()
+        # joining the cancelled call would replay "0" and then fail
+        return await collect(single_flight.astream('key', upstream))
+
+    assert asyncio.run(main()) == "01234"
+    assert upstream.calls == 2
+    assert upstream.cancelled == 1
+
+
+def test_astream_propagates_the_error_after_the_chunks_sent_so_far():
+    single_flight = SingleFlight()
+    upstream = Upstream(fail_after=2)
+
+    async def read(received):
+        async for chunk in single_flight.astream('key', upstream):
+            received.append(chunk)
+
+    async def main():
+        received = [[], []]
+        results = await asyncio.gather(read(received[0]), read(received[1]), return_exceptions=True)
+        return received, results
+
+    received, results = asyncio.run(main())
+    assert received == [["0", "1"], ["0", "1"]]
+    assert all(isinstance(result, ValueError) for result in results)
+    assert upstream.calls == 1